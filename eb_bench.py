@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Benchmarks of CC6 generation with synthetic layouts
+#
+# Usage: python eb_bench.py --sizes 1e3,1e4,1e5 --cases dots,squares,spots
+#        python eb_bench.py --compare   (latest run against the one before)
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from eb_dot import CC6Writer
+from eb_profile import Profiler
+
+_RESULTS = "bench_results.jsonl"  # One JSON result per line
+
+
+## Dot arrays through createPatterns / myShape (18 lines per pattern)
+def _dots(writer, n):
+    patterns = max(1, int(round(n / 18.0)))
+    lv2num = max(1, int(math.ceil(math.sqrt(patterns / 100.0))))
+    lv1num = max(1, int(math.ceil(math.sqrt(float(patterns) / lv2num**2))))
+    size = min(1400.0, 300000.0 / lv2num / 8)
+    lv1width = (300000.0 / lv2num - 2 * size) / lv1num * 0.99
+    writer.createPatterns(lv1num, lv1num, lv2num, lv2num, lv1width, lv1width, 1.0, size)
+
+
+## Rectangles through drawSquare
+def _squares(writer, n):
+    r = np.random.default_rng(0)
+    x = r.uniform(0, 299000, n).tolist()
+    y = r.uniform(0, 299000, n).tolist()
+    size = r.uniform(20, 1000, n).tolist()
+    for i in range(n):
+        writer.drawSquare(x[i], y[i], x[i] + size[i], y[i] + size[i], 2.0)
+
+
+## Spots through drawSpot
+def _spots(writer, n):
+    r = np.random.default_rng(0)
+    x = r.uniform(0, 300000, n).tolist()
+    y = r.uniform(0, 300000, n).tolist()
+    for i in range(n):
+        writer.drawSpot(x[i], y[i], 1.0)
+
+
+_CASES = {"dots": _dots, "squares": _squares, "spots": _spots}
+
+
+## Run one case in this process (called in a new process by _measure)
+def _runCase(case, n, preview, directory, queue):
+    fileName = os.path.join(directory, "%s_%d" % (case, n))
+    profile = Profiler()
+    writer = CC6Writer()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.open(fileName, preview=preview, profile=profile)
+        _CASES[case](writer, n)
+        writer.close()
+    wall = time.perf_counter() - start
+    # ru_maxrss is in kB on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    calls = profile.results()["calls"]
+    phases = dict(profile.phases)
+    queue.put(
+        {
+            "case": case,
+            "size": n,
+            "commands": writer._commandCount,
+            "wall": wall,
+            # CC6 formatting includes file writes
+            "cc6Time": calls["CC6 format"]["seconds"],
+            "dxfTime": calls["DXF entities"]["seconds"] + phases["DXF save"],
+            "phases": phases,
+            "calls": calls,
+            "peakRSS": rss,
+            "bytes": profile.bytes,
+        }
+    )
+
+
+## Measure one case in a separate process, so peak RSS is its own
+#
+# @param timeout Stop the case after this many seconds (None: no limit)
+# @return Result dict, or dict with "error" if the case failed (exception,
+#         killed e.g. out of memory, or timeout)
+def _measure(case, n, preview, timeout=None):
+    directory = tempfile.mkdtemp(prefix="eb_bench_")
+    try:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_runCase, args=(case, n, preview, directory, results)
+        )
+        process.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        result = None
+        error = None
+        while result is None:
+            alive = process.is_alive()
+            try:
+                result = results.get(timeout=1.0)
+            except queue.Empty:
+                if not alive:
+                    break  # Ended without result
+                if deadline is not None and time.monotonic() > deadline:
+                    process.terminate()
+                    error = "timeout after %g s" % timeout
+                    break
+        process.join()
+        if error is None and (result is None or process.exitcode != 0):
+            error = "exit code %s" % process.exitcode
+        if error is not None:
+            return {"case": case, "size": n, "error": error}
+        return result
+    finally:
+        shutil.rmtree(directory)
+
+
+## Current git commit, or None
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+## Print one result
+def _show(result):
+    print(
+        "%-8s %9d %9d cmd %8.2f s (CC6 %6.2f, DXF %6.2f) %7.1f MB RSS  CC6 %10d B  dxf %10d B"
+        % (
+            result["case"],
+            result["size"],
+            result["commands"],
+            result["wall"],
+            result["cc6Time"],
+            result["dxfTime"],
+            result["peakRSS"] / 1048576.0,
+            result["bytes"].get("CC6", 0),
+            result["bytes"].get("dxf", 0),
+        )
+    )
+
+
+## Compare last run with the run before (same case and size)
+#
+# @param threshold Report as regression if time or memory grows more than this
+def compare(resultsFile=_RESULTS, threshold=0.1):
+    with open(resultsFile) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    runIds = sorted(set(run["run"] for run in runs))
+    if len(runIds) < 2:
+        print("Need two runs to compare")
+        return
+    old = dict(
+        ((r["case"], r["size"], r["preview"]), r) for r in runs if r["run"] == runIds[-2]
+    )
+    new = [r for r in runs if r["run"] == runIds[-1]]
+    oldCommit = [r.get("commit") for r in runs if r["run"] == runIds[-2]][0]
+    print("%s (%s) -> %s (%s)" % (runIds[-2], oldCommit, runIds[-1], new[0].get("commit")))
+    for result in new:
+        before = old.get((result["case"], result["size"], result["preview"]))
+        if before is None:
+            continue
+        line = "%-8s %9d" % (result["case"], result["size"])
+        for name, key in (
+            ("time", "wall"),
+            ("CC6", "cc6Time"),
+            ("DXF", "dxfTime"),
+            ("RSS", "peakRSS"),
+        ):
+            ratio = result[key] / max(before[key], 1e-9)
+            line += "  %s x%.2f" % (name, ratio)
+            if ratio > 1.0 + threshold:
+                line += " REGRESSION"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CC6 generation")
+    parser.add_argument("--sizes", default="1e3,1e4,1e5", help="numbers of commands")
+    parser.add_argument("--cases", default=",".join(_CASES), help="dots,squares,spots")
+    parser.add_argument(
+        "--preview", default="sync", choices=("sync", "deferred", "async", "png", "off")
+    )
+    parser.add_argument("--results", default=_RESULTS, help="JSON lines file of results")
+    parser.add_argument("--compare", action="store_true", help="only compare last two runs")
+    parser.add_argument(
+        "--threshold", type=float, default=0.1, help="relative growth shown as regression"
+    )
+    parser.add_argument("--timeout", type=float, help="seconds per case (default: no limit)")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.results, args.threshold)
+        return
+
+    run = time.strftime("%Y%m%d-%H%M%S")
+    commit = _commit()
+    with open(args.results, "a") as f:
+        for case in args.cases.split(","):
+            for n in [int(float(v)) for v in args.sizes.split(",")]:
+                result = _measure(case, n, args.preview, args.timeout)
+                if "error" in result:
+                    print("%-8s %9d FAILED (%s)" % (case, n, result["error"]))
+                    continue
+                result.update(run=run, commit=commit, preview=args.preview)
+                _show(result)
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Cache of level 2 blocks drawn by createPatterns (see CC6Writer.open(cache=...))
+
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+
+
+## Content-addressed cache of createPatterns blocks
+#
+#  Each level 2 block (patterns and 10 bit marker, see
+#  CC6Writer._createBlock) is stored under a hash of everything it is made
+#  from: createPatterns arguments of the block, PatternLayout, myShape
+#  constants, unit, dose limits (CC6Writer._cacheInputs) and the source
+#  files of the writer class. Blocks found in the cache are not drawn
+#  again, so only blocks with changed inputs are regenerated; outputs are
+#  the same as without cache.
+#  HOWTO:
+#  1. hoge.open(your_filename_here, cache=JobCache("eb_cache"))
+#  2. hoge.createPatterns(...) draws only blocks not in eb_cache/
+class JobCache:
+    ## @param directory Directory of cached blocks (made if missing)
+    def __init__(self, directory="eb_cache"):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._codeHashes = {}  # Writer class to hash of its source files
+        os.makedirs(directory, exist_ok=True)
+
+    ## Hash of the source files of writer class and its bases
+    def _codeHash(self, writerClass):
+        if writerClass not in self._codeHashes:
+            digest = hashlib.sha256()
+            for cls in writerClass.__mro__[:-1]:  # without object
+                fileName = inspect.getsourcefile(cls)
+                with open(fileName, "rb") as f:
+                    digest.update(f.read())
+            self._codeHashes[writerClass] = digest.hexdigest()
+        return self._codeHashes[writerClass]
+
+    ## Key of one block
+    #
+    # @param writer CC6Writer drawing the block
+    # @param job Arguments of CC6Writer._createBlock
+    def key(self, writer, job):
+        text = repr((writer._cacheInputs(), tuple(job), self._codeHash(type(writer))))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    ## Stored block, or None
+    #
+    # @return (block, printed text) as made by _blockWorker
+    def load(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                block = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return block
+
+    ## Store block (written to a temporary file first, so readers never see
+    # half written files)
+    def store(self, key, block):
+        path = self._path(key)
+        temporary = "%s.%d.tmp" % (path, os.getpid())
+        with open(temporary, "wb") as f:
+            pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    ## Remove all cached blocks
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+    ## Report as text lines
+    def report(self):
+        return [
+            "Cached blocks: %6d reused, %d drawn (%s)"
+            % (self.hits, self.misses, self.directory)
+        ]
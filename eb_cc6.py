@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# CC6 command format: command table, writer stream and reader
+#このファイルの単位はEB描画セル(cell)
+
+import mmap
+
+import numpy as np
+
+
+## Opcodes of CC6 commands
+DWLL = 0  # Line
+DWSL = 1  # Rectangle
+DWSPS = 2  # Spot
+COMMAND_NAMES = ("DWLL", "DWSL", "DWSPS")
+
+## Row type of CommandTable
+#
+#  Coordinates are in EB drawing cells exactly as written in CC6
+#  (y is flipped for DWLL/DWSL, x2/y2 are 0 for DWSPS).
+#  Dose is kept as float64 so that "%.1f" gives the same text as before.
+COMMAND_DTYPE = np.dtype(
+    [
+        ("op", "u1"),
+        ("x1", "i4"),
+        ("y1", "i4"),
+        ("x2", "i4"),
+        ("y2", "i4"),
+        ("dose", "f8"),
+    ]
+)
+
+
+## Make CommandTable rows from arrays
+#
+# @param op Opcode (DWLL, DWSL or DWSPS) for all rows
+# @param x1, y1, x2, y2 Coordinates (cells)
+# @param dose Dose times (μsec.)
+def makeCommands(op, x1, y1, x2, y2, dose):
+    rows = np.empty(len(dose), COMMAND_DTYPE)
+    rows["op"] = op
+    rows["x1"] = x1
+    rows["y1"] = y1
+    rows["x2"] = x2
+    rows["y2"] = y2
+    rows["dose"] = dose
+    return rows
+
+
+## Positions of commands in nm, y upwards as given to the draw functions
+#
+# @param rows Array of COMMAND_DTYPE
+# @param unit Unit length per EB drawing cell (nm)
+# @param patchSize Size of single patch (nm)
+# @return (x1, y1, x2, y2) float arrays. For spots x2 = x1 and y2 = y1.
+def commandPositions(rows, unit=5.0, patchSize=300000):
+    spot = rows["op"] == DWSPS
+    x1 = rows["x1"] * unit
+    x2 = np.where(spot, x1, rows["x2"] * unit)
+    # y is flipped in CC6 except for spots
+    y1 = np.where(spot, rows["y1"] * unit, patchSize - rows["y1"] * unit)
+    y2 = np.where(spot, y1, patchSize - rows["y2"] * unit)
+    return x1, y1, x2, y2
+
+
+## One CC6 command, as returned when iterating a CommandTable
+class CC6Command:
+    __slots__ = ("op", "x1", "y1", "x2", "y2", "dose")
+
+    def __init__(self, op, x1, y1, x2, y2, dose):
+        self.op = op
+        self.x1 = x1
+        self.y1 = y1
+        self.x2 = x2
+        self.y2 = y2
+        self.dose = dose
+
+    def __repr__(self):
+        return "%s(%d,%d,%d,%d,%.1f)" % (
+            COMMAND_NAMES[self.op],
+            self.x1,
+            self.y1,
+            self.x2,
+            self.y2,
+            self.dose,
+        )
+
+
+## Compact table of all CC6 commands of a job
+#
+#  Rows are stored in NumPy arrays of COMMAND_DTYPE (25 bytes per command).
+#  Single commands are collected in a short list and packed every chunkSize
+#  rows. Listeners (CC6 output, dxf preview, ...) get every packed chunk,
+#  in the order the commands were added.
+class CommandTable:
+    def __init__(self, chunkSize=1 << 16):
+        self._chunkSize = chunkSize
+        self._chunks = []
+        self._pending = []
+        self._packedCount = 0
+        self._listeners = []
+
+    ## Call listener(rows) for every chunk of new commands
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    ## Add single command
+    def append(self, op, x1, y1, x2, y2, dose):
+        self._pending.append((op, x1, y1, x2, y2, dose))
+        if len(self._pending) >= self._chunkSize:
+            self.flush()
+
+    ## Add array of COMMAND_DTYPE rows
+    def extend(self, rows):
+        self.flush()
+        self._add(rows)
+
+    ## Pack single commands and pass them to listeners
+    def flush(self):
+        if self._pending:
+            rows = np.array(self._pending, COMMAND_DTYPE)
+            self._pending = []
+            self._add(rows)
+
+    def _add(self, rows):
+        if len(rows) == 0:
+            return
+        self._chunks.append(rows)
+        self._packedCount += len(rows)
+        for listener in self._listeners:
+            listener(rows)
+
+    def __len__(self):
+        return self._packedCount + len(self._pending)
+
+    def __iter__(self):
+        for rows in self.chunks():
+            for row in rows.tolist():
+                yield CC6Command(*row)
+
+    ## Iterate over stored arrays
+    def chunks(self):
+        self.flush()
+        return iter(self._chunks)
+
+    ## All commands as one array
+    def toArray(self):
+        self.flush()
+        if not self._chunks:
+            return np.empty(0, COMMAND_DTYPE)
+        return np.concatenate(self._chunks)
+
+    ## Number of commands for each opcode
+    def stats(self):
+        counts = np.zeros(len(COMMAND_NAMES), int)
+        for rows in self.chunks():
+            counts += np.bincount(rows["op"], minlength=len(COMMAND_NAMES))
+        return dict(zip(COMMAND_NAMES, counts.tolist()))
+
+
+## Buffered output stream of CC6 commands
+#
+#  Commands are formatted into a buffer which is written out in large chunks,
+#  so memory use does not depend on the number of commands.
+class CC6Stream:
+    # line end is CR (\x0D) + LF (\x0A)
+    _formats = (
+        "DWLL(%d,%d,%d,%d,%.1f) ;3\r\n",
+        "DWSL(%d,%d,%d,%d,1,%.1f) ;3\r\n",
+        "DWSPS(%d,%d,10,%.1f) ;2\r\n",
+    )
+    _columns = (
+        ("x1", "y1", "x2", "y2", "dose"),
+        ("x1", "y1", "x2", "y2", "dose"),
+        ("x1", "y1", "dose"),
+    )
+
+    ## @param sink Opened file, or any object with write() (e.g. io.StringIO)
+    # @param bufferSize Number of characters to collect before writing
+    def __init__(self, sink, bufferSize=1 << 20):
+        self._sink = sink
+        self._bufferSize = bufferSize
+        self._buffer = []
+        self._bufferLength = 0
+        self.charCount = 0  # Number of characters written to sink
+
+    ## Write first line
+    def begin(self):
+        self.write("PATTERN\r\n")
+
+    ## Write final line and flush
+    def end(self):
+        self.write("END\r\n")
+        self.write("\x1A")  # Ctrl-Z sequence
+        self.flush()
+
+    ## Add text to buffer, and write out if buffer is full
+    def write(self, text):
+        self._buffer.append(text)
+        self._bufferLength += len(text)
+        if self._bufferLength >= self._bufferSize:
+            self.flush()
+
+    ## Write out buffer to sink
+    def flush(self):
+        if self._buffer:
+            text = "".join(self._buffer)
+            self._sink.write(text)
+            self.charCount += len(text)
+            self._buffer.clear()
+            self._bufferLength = 0
+
+    ## Write CommandTable rows
+    def writeCommands(self, rows):
+        op = rows["op"]
+        # Format each run of same opcode column-wise
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(op)) + 1))
+        ends = np.append(starts[1:], len(rows))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            kind = int(op[start])
+            run = rows[start:end]
+            columns = [run[name].tolist() for name in self._columns[kind]]
+            lineFormat = self._formats[kind]
+            self.write("".join([lineFormat % row for row in zip(*columns)]))
+
+
+## Reader of CC6 files
+#
+#  The file is memory-mapped and parsed with array operations into
+#  COMMAND_DTYPE rows (same as CommandTable), without making a Python
+#  object for each line.
+#  HOWTO:
+#  1. rows = CC6Reader("d251031hs.CC6").read()  # whole file
+#  2. for rows in CC6Reader("d251031hs.CC6").chunks(): ...  # large files
+class CC6Reader:
+    _fieldCounts = (5, 6, 4)  # Numbers in (...) of DWLL, DWSL, DWSPS
+
+    ## @param fileName CC6 file name (with extension)
+    # @param chunkSize Bytes parsed at once in chunks()
+    def __init__(self, fileName, chunkSize=1 << 20):
+        self._fileName = fileName
+        self._chunkSize = chunkSize
+
+    ## All commands in the file as one array
+    def read(self):
+        chunks = list(self.chunks())
+        if not chunks:
+            return np.empty(0, COMMAND_DTYPE)
+        return np.concatenate(chunks)
+
+    def __iter__(self):
+        for rows in self.chunks():
+            for row in rows.tolist():
+                yield CC6Command(*row)
+
+    ## Iterate over commands in arrays of about chunkSize bytes of file
+    def chunks(self):
+        with open(self._fileName, "rb") as cc6File:
+            if cc6File.seek(0, 2) == 0:
+                return
+            with mmap.mmap(cc6File.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                lineNumber = 1
+                start = 0
+                while start < len(data):
+                    end = start + self._chunkSize
+                    if end < len(data):
+                        # Cut chunk after the last line end
+                        end = data.rfind(b"\n", start, end) + 1
+                        if end <= start:
+                            end = data.find(b"\n", start) + 1 or len(data)
+                    else:
+                        end = len(data)
+                    # Copy of one chunk, so no view on mmap stays alive
+                    text = np.frombuffer(data[start:end], np.uint8)
+                    rows, lineCount = self._parse(text, lineNumber)
+                    if len(rows):
+                        yield rows
+                    lineNumber += lineCount
+                    start = end
+
+    ## Parse bytes of whole lines into rows
+    #
+    # @return (rows, number of lines)
+    def _parse(self, text, lineNumber):
+        lineEnds = np.flatnonzero(text == ord("\n"))
+        lineStarts = np.concatenate(([0], lineEnds + 1))
+        if lineStarts[-1] == len(text):
+            lineStarts = lineStarts[:-1]
+        lineCount = len(lineStarts)
+
+        # Opcode from first characters: DWLL( DWSL( DWSPS(
+        padded = np.concatenate((text, np.zeros(6, np.uint8)))
+        head = [padded[lineStarts + i] for i in range(6)]
+        isDW = (head[0] == ord("D")) & (head[1] == ord("W"))
+        op = np.full(lineCount, 255, np.uint8)
+        op[isDW & (head[2] == ord("L")) & (head[3] == ord("L")) & (head[4] == ord("("))] = DWLL
+        op[isDW & (head[2] == ord("S")) & (head[3] == ord("L")) & (head[4] == ord("("))] = DWSL
+        op[
+            isDW
+            & (head[2] == ord("S"))
+            & (head[3] == ord("P"))
+            & (head[4] == ord("S"))
+            & (head[5] == ord("("))
+        ] = DWSPS
+
+        # Numbers are runs of [0-9.-] inside (...)
+        depth = np.cumsum(
+            (text == ord("(")).astype(np.int8) - (text == ord(")")).astype(np.int8),
+            dtype=np.int32,
+        )
+        isNumber = (
+            ((text >= ord("0")) & (text <= ord("9")))
+            | (text == ord("."))
+            | (text == ord("-"))
+        ) & (depth > 0)
+        edge = np.diff(isNumber.astype(np.int8), prepend=0, append=0)
+        tokenStarts = np.flatnonzero(edge == 1)
+        tokenLengths = np.flatnonzero(edge == -1) - tokenStarts
+        values = self._numbers(padded, tokenStarts, tokenLengths)
+
+        # Tokens of each line
+        tokenLines = np.searchsorted(lineStarts, tokenStarts, "right") - 1
+        tokenCounts = np.bincount(tokenLines, minlength=lineCount)
+        firstTokens = np.cumsum(tokenCounts) - tokenCounts
+
+        isCommand = op != 255
+        expected = np.array(self._fieldCounts + (0,))[np.minimum(op, 3)]
+        bad = np.flatnonzero(isCommand & (tokenCounts != expected))
+        if len(bad):
+            raise ValueError(
+                "%s: malformed command in line %d"
+                % (self._fileName, lineNumber + bad[0])
+            )
+
+        commandLines = np.flatnonzero(isCommand)
+        op = op[commandLines]
+        first = firstTokens[commandLines]
+        rows = np.zeros(len(commandLines), COMMAND_DTYPE)
+        rows["op"] = op
+        rows["x1"] = values[first]
+        rows["y1"] = values[first + 1]
+        hasEnd = op != DWSPS
+        rows["x2"][hasEnd] = values[first[hasEnd] + 2]
+        rows["y2"][hasEnd] = values[first[hasEnd] + 3]
+        # Dose is the last number
+        rows["dose"] = values[first + np.array(self._fieldCounts)[op] - 1]
+        return rows, lineCount
+
+    ## Values of decimal numbers at given positions
+    #
+    # Digits are collected as an integer and divided by a power of 10 once,
+    # which gives the same float as float(text) for numbers in CC6 files.
+    @staticmethod
+    def _numbers(text, starts, lengths):
+        mantissa = np.zeros(len(starts), np.int64)
+        decimals = np.zeros(len(starts), np.int64)
+        afterPoint = np.zeros(len(starts), bool)
+        negative = np.zeros(len(starts), bool)
+        for i in range(int(lengths.max()) if len(lengths) else 0):
+            active = i < lengths
+            char = text[starts + i * active].astype(np.int64)
+            digit = active & (char >= ord("0")) & (char <= ord("9"))
+            mantissa = np.where(digit, mantissa * 10 + char - ord("0"), mantissa)
+            decimals += digit & afterPoint
+            afterPoint |= active & (char == ord("."))
+            negative |= active & (char == ord("-"))
+        values = mantissa / 10.0**decimals
+        values[negative] *= -1
+        return values
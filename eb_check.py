@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Finds overlapping and too close commands (double exposure) in CC6 jobs
+#
+# Usage: python eb_check.py d251031hs.CC6 --gap 10 --layout 10,10,5,5,5000,5000,1400
+
+import argparse
+
+import numpy as np
+
+from eb_cc6 import DWSL, CC6Command, CC6Reader, commandPositions
+from eb_dot import PatternLayout
+
+
+## Distance from points p to segments (a, b), arrays of N x 2
+def _pointSegment(p, a, b):
+    ab = b - a
+    length2 = (ab**2).sum(axis=1)
+    t = ((p - a) * ab).sum(axis=1) / np.where(length2 > 0, length2, 1.0)
+    t = np.clip(t, 0.0, 1.0)
+    d = p - (a + t[:, None] * ab)
+    return np.hypot(d[:, 0], d[:, 1])
+
+
+## z of cross product (b - a) x (c - a)
+def _cross(a, b, c):
+    return (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+
+
+## Distance between segments (a1, b1) and (a2, b2), arrays of N x 2
+def _segmentSegment(a1, b1, a2, b2):
+    d1 = _cross(a2, b2, a1)
+    d2 = _cross(a2, b2, b1)
+    d3 = _cross(a1, b1, a2)
+    d4 = _cross(a1, b1, b2)
+    crossing = (d1 * d2 < 0) & (d3 * d4 < 0)
+    distance = np.minimum(
+        np.minimum(_pointSegment(a1, a2, b2), _pointSegment(b1, a2, b2)),
+        np.minimum(_pointSegment(a2, a1, b1), _pointSegment(b2, a1, b1)),
+    )
+    return np.where(crossing, 0.0, distance)
+
+
+## Distance between segments (a, b) and boxes (lo, hi), arrays of N x 2
+def _segmentBox(a, b, lo, hi):
+    inside = np.all((a >= lo) & (a <= hi), axis=1)
+    corners = (
+        lo,
+        np.stack((hi[:, 0], lo[:, 1]), axis=1),
+        hi,
+        np.stack((lo[:, 0], hi[:, 1]), axis=1),
+    )
+    distance = np.full(len(a), np.inf)
+    for k in range(4):
+        distance = np.minimum(
+            distance, _segmentSegment(a, b, corners[k], corners[(k + 1) % 4])
+        )
+    return np.where(inside, 0.0, distance)
+
+
+## Distance between boxes (lo1, hi1) and (lo2, hi2), arrays of N x 2
+def _boxBox(lo1, hi1, lo2, hi2):
+    gap = np.maximum(0.0, np.maximum(lo1, lo2) - np.minimum(hi1, hi2))
+    return np.hypot(gap[:, 0], gap[:, 1])
+
+
+_SPAN = 4  # Cells per axis of a command on its grid level, and level ratio
+
+
+## Check of overlapping and too close commands
+#
+#  Every command is a segment (DWLL, DWSPS as point) or box (DWSL) in nm,
+#  exposed with width of one cell (unit). Commands are put in the cells of
+#  a grid (spatial hash, one level per command size, see _candidates)
+#  touched by their bounding box plus minGap, and only commands with
+#  touching boxes in a shared cell are compared exactly. So cost and memory
+#  grow with N and the number of close pairs, also with large pads next to
+#  small dots, instead of O(N^2).
+#  Found pairs (index in given rows, i < j):
+#  - first, second: command indices
+#  - gap: distance between exposed areas (nm), negative for overlap
+class OverlapChecker:
+    ## @param minGap Report pairs closer than this (nm), 0: overlaps only
+    # @param gridSize Size of spatial hash cells (nm), None: from command sizes
+    # @param unit Unit length per EB drawing cell (nm)
+    # @param patchSize Size of single patch (nm)
+    def __init__(self, minGap=0.0, gridSize=None, unit=5.0, patchSize=300000):
+        self.minGap = minGap
+        self.gridSize = gridSize
+        self._unit = unit
+        self._patchSize = patchSize
+        self.first = np.zeros(0, int)
+        self.second = np.zeros(0, int)
+        self.gap = np.zeros(0)
+        self.position = np.zeros((0, 2))  # Where pair comes close (nm)
+        self._rows = None
+        self._cells = None
+
+    ## Find pairs in commands (COMMAND_DTYPE)
+    #
+    # @param layout PatternLayout to report lv1/lv2 cell of pairs, or None
+    def check(self, rows, layout=None):
+        self._rows = rows
+        x1, y1, x2, y2 = commandPositions(rows, self._unit, self._patchSize)
+        a = np.stack((x1, y1), axis=1)
+        b = np.stack((x2, y2), axis=1)
+        lo = np.minimum(a, b)
+        hi = np.maximum(a, b)
+
+        first, second = self._candidates(lo, hi)
+        box = rows["op"] == DWSL
+        boxI = box[first]
+        boxJ = box[second]
+        distance = np.empty(len(first))
+        both = boxI & boxJ
+        distance[both] = _boxBox(lo[first[both]], hi[first[both]], lo[second[both]], hi[second[both]])
+        none = ~boxI & ~boxJ
+        distance[none] = _segmentSegment(
+            a[first[none]], b[first[none]], a[second[none]], b[second[none]]
+        )
+        # Segment and box, in either order
+        seg = np.where(boxJ, first, second)
+        rect = np.where(boxJ, second, first)
+        mixed = boxI != boxJ
+        distance[mixed] = _segmentBox(
+            a[seg[mixed]], b[seg[mixed]], lo[rect[mixed]], hi[rect[mixed]]
+        )
+
+        # Exposed area is one cell wide around the center lines of cells
+        gap = distance - self._unit
+        found = gap < max(self.minGap, 0.0)
+        self.first = first[found]
+        self.second = second[found]
+        self.gap = gap[found]
+        # Where the boxes come close: middle of the overlap of their
+        # bounding boxes (of the gap between them on axes without overlap)
+        near = np.maximum(lo[self.first], lo[self.second])
+        far = np.minimum(hi[self.first], hi[self.second])
+        self.position = (near + far) / 2
+        self._cells = None
+        if layout is not None:
+            self._cells = np.stack(layout.locate(*self.position.T), axis=1)
+        return self
+
+    def __len__(self):
+        return len(self.first)
+
+    ## Report as text lines
+    #
+    # @param limit Maximum number of pairs listed
+    def report(self, limit=50):
+        overlaps = int(np.count_nonzero(self.gap < 0))
+        lines = [
+            "Overlapping pairs: %8d" % overlaps,
+            "Too close pairs:   %8d (gap < %g nm)" % (len(self) - overlaps, self.minGap),
+        ]
+        for k in range(min(limit, len(self))):
+            i, j = int(self.first[k]), int(self.second[k])
+            line = "  #%d %r / #%d %r gap %.1f nm at (%.0f, %.0f)" % (
+                (i, CC6Command(*self._rows[i].tolist()), j, CC6Command(*self._rows[j].tolist()))
+                + (self.gap[k],)
+                + tuple(self.position[k])
+            )
+            if self._cells is not None:
+                lv1x, lv1y, lv2x, lv2y = self._cells[k].tolist()
+                line += " lv2 (%d,%d) lv1 (%d,%d)" % (lv2x, lv2y, lv1x, lv1y)
+            lines.append(line)
+        if len(self) > limit:
+            lines.append("  ... %d more" % (len(self) - limit))
+        return lines
+
+    ## Pairs of commands with touching bounding boxes (+ minGap) (i < j, unique)
+    #
+    # Commands are put on grid levels by their size: level L has cells of
+    # gridSize * 4^L, and a command is on the lowest level where it spans
+    # at most 4 cells per axis, so it is put in at most 6 x 6 cells of its
+    # level. It is also put in the (at most 2 x 2) cells of every coarser
+    # level that has commands, so large pads are found next to small dots
+    # without putting the pad in millions of small cells.
+    def _candidates(self, lo, hi):
+        n = len(lo)
+        if n < 2:
+            return np.zeros(0, int), np.zeros(0, int)
+        margin = max(self.minGap, 0.0) + self._unit
+        lo = lo - margin
+        hi = hi + margin
+        size = self.gridSize
+        if size is None:
+            size = max(float(np.median((hi - lo).max(axis=1))), 4 * margin)
+        origin = lo.min(axis=0)  # Cell numbers from 0
+        lo = lo - origin
+        hi = hi - origin
+        extent = (hi - lo).max(axis=1)
+        level = np.zeros(n, int)
+        while True:
+            larger = extent > _SPAN * size * float(_SPAN) ** level
+            if not larger.any():
+                break
+            level[larger] += 1
+
+        first = []
+        second = []
+        for L in np.unique(level).tolist():
+            members = np.flatnonzero(level <= L)
+            i, j = self._cellPairs(
+                lo[members], hi[members], size * float(_SPAN) ** L, level[members] == L
+            )
+            first.append(members[i])
+            second.append(members[j])
+        first = np.concatenate(first)
+        second = np.concatenate(second)
+        pair = np.unique(np.minimum(first, second) * n + np.maximum(first, second))
+        return pair // n, pair % n
+
+    ## Pairs with overlapping boxes sharing a grid cell, on one grid level
+    #
+    # @param owner Commands of this level; pairs of two other (smaller)
+    #              commands are found on their own level
+    @classmethod
+    def _cellPairs(cls, lo, hi, size, owner):
+        command, key = cls._cells(lo, hi, size)
+        isOwner = owner[command]
+        # Smaller commands only in cells with commands of this level
+        query = ~isOwner & np.isin(key, key[isOwner])
+        first, second = cls._sweep(lo, hi, command[isOwner], key[isOwner])
+        i, j = cls._inCells(lo, hi, command[isOwner], key[isOwner], command[query], key[query])
+        return np.concatenate((first, i)), np.concatenate((second, j))
+
+    ## (command, cell key) for all grid cells of every command
+    @staticmethod
+    def _cells(lo, hi, size):
+        c0 = np.floor(lo / size).astype(np.int64)
+        c1 = np.floor(hi / size).astype(np.int64)
+        nx = c1[:, 0] - c0[:, 0] + 1
+        count = nx * (c1[:, 1] - c0[:, 1] + 1)
+        command = np.repeat(np.arange(len(lo)), count)
+        local = np.arange(len(command)) - np.repeat(np.cumsum(count) - count, count)
+        cx = c0[command, 0] + local % nx[command]
+        cy = c0[command, 1] + local // nx[command]
+        return command, cy * (int(c1[:, 0].max()) + 1) + cx
+
+    ## Pairs of overlapping boxes among entries (command, key)
+    #
+    # Entries are sorted by cell and left edge; each entry is compared with
+    # the next ones in its cell only while their left edges are left of its
+    # right edge (sweep), so the cost depends on the boxes overlapping in x,
+    # not on all pairs of a crowded cell.
+    @staticmethod
+    def _sweep(lo, hi, command, key):
+        order = np.lexsort((lo[command, 0], key))
+        key = key[order]
+        command = command[order]
+        first = [np.zeros(0, int)]
+        second = [np.zeros(0, int)]
+        entry = np.arange(len(key))
+        k = 1
+        while len(entry):
+            entry = entry[entry + k < len(key)]
+            other = entry + k
+            i = command[entry]
+            j = command[other]
+            same = (key[other] == key[entry]) & (lo[j, 0] <= hi[i, 0])
+            entry, i, j = entry[same], i[same], j[same]
+            found = (lo[j, 1] <= hi[i, 1]) & (lo[i, 1] <= hi[j, 1])
+            first.append(i[found])
+            second.append(j[found])
+            k += 1
+        return np.concatenate(first), np.concatenate(second)
+
+    ## Pairs of overlapping boxes between entries a and entries b
+    #
+    # Entries b are sorted by (cell, left edge); for each entry a, the b
+    # entries in its cell with left edge up to its right edge are one range
+    # found by binary search, only they are compared.
+    @staticmethod
+    def _inCells(lo, hi, commandA, keyA, commandB, keyB):
+        if len(commandA) == 0 or len(commandB) == 0:
+            return np.zeros(0, int), np.zeros(0, int)
+        order = np.lexsort((lo[commandB, 0], keyB))
+        commandB = commandB[order]
+        # Sortable (cell, rank of left edge) numbers
+        edges = np.unique(lo[commandB, 0])
+        width = len(edges) + 1
+        sortKey = keyB[order] * width + np.searchsorted(edges, lo[commandB, 0])
+        start = np.searchsorted(sortKey, keyA * width)
+        end = np.searchsorted(sortKey, keyA * width + np.searchsorted(edges, hi[commandA, 0], "right"))
+        count = end - start
+        i = np.repeat(commandA, count)
+        j = commandB[np.arange(count.sum()) - np.repeat(np.cumsum(count) - count - start, count)]
+        found = (hi[j, 0] >= lo[i, 0]) & (lo[j, 1] <= hi[i, 1]) & (lo[i, 1] <= hi[j, 1])
+        return i[found], j[found]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find overlapping commands in CC6 file")
+    parser.add_argument("fileName")
+    parser.add_argument("--gap", type=float, default=0.0, help="minimum gap (nm)")
+    parser.add_argument(
+        "--layout",
+        help="createPatterns arguments lv1xnum,lv1ynum,lv2xnum,lv2ynum,"
+        "lv1width,lv1height[,size10BitMarker] to show cells of pairs",
+    )
+    parser.add_argument("--limit", type=int, default=50, help="pairs to list")
+    args = parser.parse_args()
+
+    layout = None
+    if args.layout:
+        values = [float(v) for v in args.layout.split(",")]
+        layout = PatternLayout(*[int(v) for v in values[:4]], *values[4:])
+
+    checker = OverlapChecker(args.gap)
+    checker.check(CC6Reader(args.fileName).read(), layout)
+    for line in checker.report(args.limit):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Compares two CC6 jobs command by command
+#
+# Usage: python eb_diff.py d251002hs.CC6 d251031hs.CC6 --layout 10,10,5,5,5000,5000,1400
+
+import argparse
+
+import numpy as np
+
+from eb_cc6 import CC6Command, CC6Reader, commandPositions
+from eb_dot import PatternLayout
+
+_KEY_FIELDS = ("op", "x1", "y1", "x2", "y2")
+
+
+## Order of rows by shape (opcode and coordinates), and occurrence number
+#
+# The occurrence number counts identical shapes, so that a shape written
+# twice in one job is matched with the same shape written twice in the other.
+def _sortedKeys(rows):
+    order = np.lexsort([rows[name] for name in reversed(_KEY_FIELDS)])
+    keys = rows[list(_KEY_FIELDS)][order]
+    isNew = np.ones(len(keys), bool)
+    isNew[1:] = keys[1:] != keys[:-1]
+    groupStart = np.maximum.accumulate(np.where(isNew, np.arange(len(keys)), 0))
+    occurrence = np.empty(len(keys), np.int64)
+    occurrence[order] = np.arange(len(keys)) - groupStart
+    return occurrence
+
+
+## Difference between two command arrays (COMMAND_DTYPE)
+#
+#  Shapes are matched by opcode and coordinates with a sorted join, so
+#  the cost is O(N log N) for N commands.
+#  - added: rows only in new
+#  - removed: rows only in old
+#  - changed: rows of new whose dose differs from the matched row of old
+#             (oldDose has the dose in old)
+class CC6Diff:
+    def __init__(self, old, new, doseTolerance=1e-6):
+        both = np.concatenate((old, new))
+        source = np.repeat([0, 1], [len(old), len(new)])
+        occurrence = np.concatenate((_sortedKeys(old), _sortedKeys(new)))
+        keys = [both[name] for name in _KEY_FIELDS] + [occurrence]
+        order = np.lexsort([source] + list(reversed(keys)))
+
+        # Matched pairs are neighbors after sorting: old row, then new row
+        same = np.ones(len(order) - 1 if len(order) else 0, bool)
+        for key in keys:
+            same &= key[order[1:]] == key[order[:-1]]
+        pairs = np.flatnonzero(same)
+        oldIndex = order[pairs]
+        newIndex = order[pairs + 1]
+
+        matched = np.zeros(len(both), bool)
+        matched[oldIndex] = True
+        matched[newIndex] = True
+        self.removed = old[~matched[: len(old)]]
+        self.added = new[~matched[len(old) :]]
+
+        oldDose = both["dose"][oldIndex]
+        newDose = both["dose"][newIndex]
+        changed = np.abs(newDose - oldDose) > doseTolerance
+        self.changed = both[newIndex[changed]]
+        self.oldDose = oldDose[changed]
+        self.unchangedCount = len(pairs) - int(np.count_nonzero(changed))
+
+    ## Nothing changed
+    def __bool__(self):
+        return bool(len(self.added) or len(self.removed) or len(self.changed))
+
+    ## Counts of added/removed/changed commands for each pattern
+    #
+    # @param layout PatternLayout of the job
+    # @return dict {(lv2x, lv2y, lv1x, lv1y): [added, removed, changed]}.
+    #         Cells are -1 outside the layout (e.g. 10 bit markers have lv1 -1).
+    def byCell(self, layout, unit=5.0, patchSize=300000):
+        cells = {}
+        for i, rows in enumerate((self.added, self.removed, self.changed)):
+            if len(rows) == 0:
+                continue
+            x1, y1, x2, y2 = commandPositions(rows, unit, patchSize)
+            lv1x, lv1y, lv2x, lv2y = layout.locate((x1 + x2) / 2, (y1 + y2) / 2)
+            found, counts = np.unique(
+                np.stack((lv2x, lv2y, lv1x, lv1y), axis=1), axis=0, return_counts=True
+            )
+            for cell, count in zip(map(tuple, found.tolist()), counts.tolist()):
+                cells.setdefault(cell, [0, 0, 0])[i] = count
+        return cells
+
+    ## Report as text lines
+    def report(self, layout=None, unit=5.0, patchSize=300000):
+        lines = [
+            "Unchanged: %10d" % self.unchangedCount,
+            "Added:     %10d" % len(self.added),
+            "Removed:   %10d" % len(self.removed),
+            "Dose changed: %7d" % len(self.changed),
+        ]
+        if layout is not None and self:
+            lines.append("lv2x lv2y lv1x lv1y    added  removed  changed")
+            for cell, counts in sorted(self.byCell(layout, unit, patchSize).items()):
+                lines.append("%4d %4d %4d %4d %8d %8d %8d" % (cell + tuple(counts)))
+        else:
+            for sign, rows in (("+", self.added), ("-", self.removed)):
+                for row in rows[:20].tolist():
+                    lines.append("%s %r" % (sign, CC6Command(*row)))
+        return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two CC6 files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--layout",
+        help="createPatterns arguments lv1xnum,lv1ynum,lv2xnum,lv2ynum,"
+        "lv1width,lv1height[,size10BitMarker] to group changes by pattern",
+    )
+    args = parser.parse_args()
+
+    layout = None
+    if args.layout:
+        values = [float(v) for v in args.layout.split(",")]
+        counts = [int(v) for v in values[:4]]
+        layout = PatternLayout(*counts, *values[4:])
+
+    diff = CC6Diff(CC6Reader(args.old).read(), CC6Reader(args.new).read())
+    for line in diff.report(layout):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
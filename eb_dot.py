@@ -5,8 +5,205 @@
 # Creates EB lithography command files (.CC6)
 #このファイルの単位はnm
 
+import contextlib
+import io
+import multiprocessing
+import os
+
 import numpy as np
-from dxfwrite import DXFEngine as dxf
+
+from eb_cc6 import (
+    DWLL,
+    DWSL,
+    DWSPS,
+    CC6Reader,
+    CC6Stream,
+    CommandTable,
+    makeCommands,
+)
+from eb_dxf import DXFStream
+
+
+# Rectangles (startX, startY, endX, endY) of 10 bit marker digit
+# in units of line width (size / 7), relative to marker center
+_MARKER_FIX = ((-2.5, 2.5, -0.5, 3.5), (0.5, 2.5, 2.5, 3.5))
+_MARKER_X_BITS = (  # x(1), x(2), x(4), x(8), x(16)
+    (-3.5, 0.5, -2.5, 2.5),
+    (-2.5, -0.5, -0.5, 0.5),
+    (-0.5, 0.5, 0.5, 2.5),
+    (0.5, -0.5, 2.5, 0.5),
+    (2.5, 0.5, 3.5, 2.5),
+)
+_MARKER_Y_BITS = (  # y(1), y(2), y(4), y(8), y(16)
+    (-3.5, -2.5, -2.5, -0.5),
+    (-2.5, -3.5, -0.5, -2.5),
+    (-0.5, -2.5, 0.5, -0.5),
+    (0.5, -3.5, 2.5, -2.5),
+    (2.5, -2.5, 3.5, -0.5),
+)
+_MARKER_BITS = 5  # Bits of x and y in one marker digit
+
+
+## Background process of DXFPreview in "async" mode
+def _previewWorker(fileName, queue, unit, patchSize):
+    with open(fileName, "w", encoding="cp1252", errors="replace") as f:
+        stream = DXFStream(f, unit, patchSize)
+        stream.begin()
+        while True:
+            rows = queue.get()
+            if rows is None:
+                break
+            stream.writeCommands(rows)
+        stream.end()
+
+
+_blockWriter = None  # Writer of each createPatterns worker process
+
+
+## Set up writer copy in createPatterns worker process
+def _blockInit(writerClass, state):
+    global _blockWriter
+    _blockWriter = writerClass.__new__(writerClass)
+    _blockWriter.__dict__.update(state)
+
+
+## Draw one level 2 block with writer copy
+#
+# @return Drawn commands (see CC6Writer._takeBlock) and printed text
+def _runBlock(writer, job):
+    text = io.StringIO()
+    with contextlib.redirect_stdout(text):
+        writer._createBlock(*job)
+    return writer._takeBlock(), text.getvalue()
+
+
+## Draw one level 2 block in worker process (see _runBlock)
+def _blockWorker(job):
+    return _runBlock(_blockWriter, job)
+
+
+## DXF preview of CommandTable rows
+#
+#  mode "sync": entities of each chunk are written to the file (DXFStream)
+#  mode "async": chunks are sent through a queue to a background process
+#  mode "off": nothing is done
+#  The file is the same as made with dxfwrite entities, in the same encoding.
+class DXFPreview:
+    def __init__(self, fileName, unit, patchSize, mode="sync"):
+        self._mode = mode
+        self._unit = unit
+        self._patchSize = patchSize
+        if mode == "sync":
+            self._file = open(fileName, "w", encoding="cp1252", errors="replace")
+            self._stream = DXFStream(self._file, unit, patchSize)
+            self._stream.begin()
+        elif mode == "async":
+            self._queue = multiprocessing.Queue(maxsize=64)
+            self._worker = multiprocessing.Process(
+                target=_previewWorker,
+                args=(fileName, self._queue, unit, patchSize),
+                daemon=True,
+            )
+            self._worker.start()
+
+    ## Add CommandTable rows
+    def commands(self, rows):
+        if self._mode == "sync":
+            self._stream.writeCommands(rows)
+        elif self._mode == "async":
+            self._queue.put(rows)
+
+    ## Write out dxf file (waits for background process in "async" mode)
+    def save(self):
+        if self._mode == "sync":
+            self._stream.end()
+            self._file.close()
+        elif self._mode == "async":
+            self._queue.put(None)
+            self._worker.join()
+
+
+## Positions of patterns made by CC6Writer.createPatterns
+#
+#  Level 2 blocks (10 bit marker + level 1 grid) are centered in the patch.
+#  patchSize may also be (width, height) of a larger area.
+#  All positions are in nm with y upwards (same as the draw functions).
+class PatternLayout:
+    def __init__(
+        self,
+        lv1xnum,
+        lv1ynum,
+        lv2xnum,
+        lv2ynum,
+        lv1width,
+        lv1height,
+        size10BitMarker=1400,
+        patchSize=300000,
+    ):
+        self.lv1xnum = lv1xnum
+        self.lv1ynum = lv1ynum
+        self.lv2xnum = lv2xnum
+        self.lv2ynum = lv2ynum
+        self.lv1width = lv1width
+        self.lv1height = lv1height
+        self.size10BitMarker = size10BitMarker
+
+        # Calculate level 2 size
+        self.lv2width = size10BitMarker * 2.0 + lv1width * (lv1xnum)
+        self.lv2height = size10BitMarker * 2.0 + lv1height * (lv1ynum)
+
+        # Total Size
+        totalWidth = self.lv2width * lv2xnum
+        totalHeight = self.lv2height * lv2ynum
+
+        # Initial position of level 2
+        if np.ndim(patchSize) == 0:
+            patchSize = (patchSize, patchSize)
+        self.lv2inix = (patchSize[0] - totalWidth) / 2.0
+        self.lv2iniy = (patchSize[1] - totalHeight) / 2.0
+
+    ## Lower left corner of level 1 grid in level 2 block (lv2x, lv2y)
+    def lv1Origin(self, lv2x, lv2y):
+        lv1inix = self.lv2inix + lv2x * self.lv2width + self.size10BitMarker * 2.0
+        lv1iniy = self.lv2iniy + lv2y * self.lv2height
+        return lv1inix, lv1iniy
+
+    ## Center of level 1 pattern
+    def center(self, lv1x, lv1y, lv2x, lv2y):
+        lv1inix, lv1iniy = self.lv1Origin(lv2x, lv2y)
+        cx = lv1inix + self.lv1width * (lv1x + 0.5)
+        cy = lv1iniy + self.lv1height * (lv1y + 0.5)
+        return cx, cy
+
+    ## Center of 10 bit marker of level 2 block
+    def markerCenter(self, lv2x, lv2y):
+        lv1inix, lv1iniy = self.lv1Origin(lv2x, lv2y)
+        return (
+            lv1inix - self.size10BitMarker,
+            lv1iniy + self.size10BitMarker + self.lv1ynum * self.lv1height,
+        )
+
+    ## Find patterns at positions
+    #
+    # @param x, y Positions (nm), arrays
+    # @return (lv1x, lv1y, lv2x, lv2y) int arrays. lv2x/lv2y are -1 outside
+    #         all level 2 blocks, lv1x/lv1y are -1 outside the level 1 grid
+    #         (e.g. 10 bit markers).
+    def locate(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        lv2x = np.floor((x - self.lv2inix) / self.lv2width).astype(int)
+        lv2y = np.floor((y - self.lv2iniy) / self.lv2height).astype(int)
+        inside = (lv2x >= 0) & (lv2x < self.lv2xnum) & (lv2y >= 0) & (lv2y < self.lv2ynum)
+        lv2x[~inside] = -1
+        lv2y[~inside] = -1
+        lv1inix, lv1iniy = self.lv1Origin(lv2x, lv2y)
+        lv1x = np.floor((x - lv1inix) / self.lv1width).astype(int)
+        lv1y = np.floor((y - lv1iniy) / self.lv1height).astype(int)
+        inside &= (lv1x >= 0) & (lv1x < self.lv1xnum) & (lv1y >= 0) & (lv1y < self.lv1ynum)
+        lv1x[~inside] = -1
+        lv1y[~inside] = -1
+        return lv1x, lv1y, lv2x, lv2y
 
 
 ## Writer class for EB lithography command files (.CC6)
@@ -26,38 +223,143 @@ class CC6Writer:
         self._maxCommand = 16000000  # Maximum limit of command counts
         self._doseTimeMin = 0.1  # Minimum dose time of EB (μsec.)
         self._doseTimeMax = 3200  # Maximum dose time of EB (μsec.)
-        self._cc6Lines = []
+        self._cc6BufferSize = 1 << 20  # CC6 output buffer (characters)
+        self._templates = {}  # Cached dots of myShape (see shapeTemplate)
+        self._layout = None  # PatternLayout of last createPatterns
+        self._markerGlyphs = {}  # Glyph tables of 10 bit markers by size
+        # Optional helpers of open() (subclasses with their own open() keep them off)
+        self._estimator = None
+        self._pathOrder = None
+        self._proximity = None
+        self._checker = None
+        self._profile = None
+        self._hierarchy = None
+        self._cache = None
+        # Constants of myShapeParams (see setShapeBase)
+        self._shapeBase = dict(Nbit=8, dose=50, dis=90, length=65, p=4, pdb=90, pbd=4)
 
     ## Open new file.
     #
     # This is the first function to be called after class instantiation.
-    # Note: dxffast is available as faster option, but may not work if
-    # there are changes to how dxfwrite is used.
     # @param fileName The output filename for CC6, dxf, and log file.
-    
-    def open(self, fileName):
+    # @param cc6Sink Write CC6 to this object (e.g. io.StringIO) instead of file
+    # @param preview How to make the dxf file:
+    #                "sync" build while drawing (default),
+    #                "deferred" rebuild from the finished CC6 file in close(),
+    #                "async" build in a background process,
+    #                "png" raster image instead (eb_raster.RasterPreview),
+    #                "off" no dxf file,
+    #                or any object with commands(rows) and save()
+    #                (e.g. eb_raster.RasterPreview(name, pixel=50, heat=True))
+    # @param estimator Exposure time estimator fed with all commands and
+    #                  reported in the log (e.g. eb_estimate.ExposureEstimator())
+    # @param pathOrder Reorder all commands in close() before writing, for
+    #                  shorter beam jumps (e.g. eb_path.PathOrder()).
+    #                  See also fixedOrder and orderBarrier.
+    # @param proximity Correct doses of all commands in close() before
+    #                  writing (e.g. eb_pec.ProximityCorrector())
+    # @param checker Check all commands for overlaps in close() and report
+    #                in the log (e.g. eb_check.OverlapChecker(minGap=10))
+    # @param profile Time draw functions, outputs and phases, and report
+    #                in the log (e.g. eb_profile.Profiler("profile.json"))
+    # @param hierarchy Also write dxf/GDSII with repeated patterns as cells
+    #                  in close() (e.g. eb_hier.CellHierarchy())
+    # @param cache Reuse level 2 blocks of createPatterns drawn before with
+    #              the same inputs (e.g. eb_cache.JobCache("eb_cache"))
+    def open(
+        self,
+        fileName,
+        cc6Sink=None,
+        preview="sync",
+        estimator=None,
+        pathOrder=None,
+        proximity=None,
+        checker=None,
+        profile=None,
+        hierarchy=None,
+        cache=None,
+    ):
+        previewObject = not isinstance(preview, str)
+        if not previewObject and preview not in ("sync", "deferred", "async", "png", "off"):
+            raise ValueError("Unknown preview mode: %s" % preview)
+        if preview == "deferred" and cc6Sink is not None:
+            raise ValueError("Deferred preview needs CC6 file")
+        self._fileName = fileName
+        self._previewMode = preview
+
         # Create CC6, write first line
-        self._cc6File = open(fileName + ".CC6", "w")
-        self._cc6File.write("PATTERN\r\n")  # line end is CR (\x0D) + LF (\x0A)
+        if cc6Sink is None:
+            # newline="" keeps CR + LF line ends as they are on every OS
+            self._cc6File = open(fileName + ".CC6", "w", newline="")
+            cc6Sink = self._cc6File
+        else:
+            self._cc6File = None
+        self._cc6 = CC6Stream(cc6Sink, self._cc6BufferSize)
+        self._cc6.begin()
+
+        # Create dxf file (or other preview)
+        if previewObject:
+            self._preview = preview
+        elif preview == "png":
+            # matplotlib is needed only for png
+            from eb_raster import RasterPreview
+
+            self._preview = RasterPreview(fileName + ".png", self._unit, self._patchSize)
+        else:
+            self._preview = DXFPreview(
+                fileName + ".dxf",
+                self._unit,
+                self._patchSize,
+                preview if preview in ("sync", "async") else "off",
+            )
 
-       
-        # Create dxf file
-        self._drawing = dxf.drawing(fileName + ".dxf")
+        # All outputs are made from the command table
+        # (with pathOrder or proximity from a second table filled in close())
+        self._commands = CommandTable()
+        self._output = self._commands
+        self._pathOrder = pathOrder
+        self._proximity = proximity
+        self._checker = checker
+        self._hierarchy = hierarchy
+        self._cache = cache
+        self._fixedRanges = []  # (start, end) command indices of fixedOrder
+        self._barriers = []  # Command indices of orderBarrier
+        if pathOrder is not None or proximity is not None:
+            self._output = CommandTable()
+        self._profile = profile
+        writeCC6 = self._cc6.writeCommands
+        writePreview = self._preview.commands
+        if profile is not None:
+            profile.attach(self)
+            self._cc6.flush = profile.timed("CC6 file write", self._cc6.flush)
+            writeCC6 = profile.timed("CC6 format", writeCC6)
+            writePreview = profile.timed("DXF entities", writePreview)
+        self._output.subscribe(writeCC6)
+        self._output.subscribe(writePreview)
+        self._estimator = estimator
+        if estimator is not None:
+            self._output.subscribe(self._estimate)
 
         # Create log text
         self._logFile = open(fileName + "_log.txt", "w")
+        if profile is not None:
+            profile.phase("generate")
 
     ## Close all written files to finalize.
     def close(self):
+        if self._profile is not None:
+            self._profile.phase("CC6 flush")
         # Write final line and close CC6 file
-        self._cc6File.write("END\r\n")
-        self._cc6File.write("\x1A")  # Ctrl-Z sequence
-        self._cc6File.close()
-
-        # Close dxf file
-        self._drawing.save()
-
-        # Write out log output and close log file
+        self._commands.flush()
+        if self._output is not self._commands:
+            self._writeBuffered()
+        self._cc6.end()
+        if self._cc6File is not None:
+            self._cc6File.close()
+
+        # Write out log output
+        if self._profile is not None:
+            self._profile.phase("reports")
         self._log("Objects: %10d" % self._commandCount)
         self._log("Errors:  %10d" % self._errorCount)
         if self._commandCount > self._maxCommand:
@@ -65,20 +367,152 @@ class CC6Writer:
                 "Number of objects exceeded maximum limit. "
                 "Please do not use this file."
             )
+        if self._estimator is not None:
+            for line in self._estimator.report():
+                self._log(line)
+        if self._checker is not None:
+            self._checker.check(self._commands.toArray(), self._layout)
+            for line in self._checker.report():
+                self._log(line)
+        if self._proximity is not None:
+            for line in self._proximity.report():
+                self._log(line)
+        if self._pathOrder is not None:
+            for line in self._pathOrder.report():
+                self._log(line)
+        if self._cache is not None:
+            for line in self._cache.report():
+                self._log(line)
+        if self._hierarchy is not None:
+            self._hierarchy.build(self._commands.toArray(), self._layout)
+            self._hierarchy.save(self._fileName)
+            for line in self._hierarchy.report():
+                self._log(line)
+
+        # Close dxf file (CC6 file is already complete here)
+        if self._profile is not None:
+            self._profile.phase("DXF save")
+        self._preview.save()
+        if self._previewMode == "deferred":
+            self.writePreview(self._fileName)
+
+        if self._profile is not None:
+            self._logProfile()
+
+        # Close log file
         self._logFile.close()
 
+    ## Write results of profile to log (and its JSON file)
+    def _logProfile(self):
+        self._profile.phase(None)
+        self._profile.bytes["CC6"] = self._cc6.charCount
+        for extension in ("dxf", "png"):
+            if os.path.exists(self._fileName + "." + extension):
+                self._profile.bytes[extension] = os.path.getsize(
+                    self._fileName + "." + extension
+                )
+        self._profile.bytes["log"] = self._logFile.tell()
+        for line in self._profile.report():
+            self._log(line)
+        if self._profile.jsonFile is not None:
+            self._profile.save()
+
+    ## Make dxf file from a finished CC6 file
+    #
+    # Same dxf as drawn with preview="sync".
+    # @param fileName CC6 file name without extension (dxf gets same name)
+    def writePreview(self, fileName):
+        preview = DXFPreview(fileName + ".dxf", self._unit, self._patchSize)
+        for rows in CC6Reader(fileName + ".CC6").chunks():
+            preview.commands(rows)
+        preview.save()
+
+    ## Table of all commands written so far (see CommandTable)
+    #
+    # Commands are in drawn order, also with pathOrder.
+    def commands(self):
+        return self._commands
+
+    ## Keep order of commands drawn inside "with" for pathOrder
+    #
+    # Commands drawn inside are moved as one group in drawn order.
+    # Example: with hoge.fixedOrder(): hoge.draw10BitMarker(...)
+    @contextlib.contextmanager
+    def fixedOrder(self):
+        start = len(self._commands)
+        yield
+        if len(self._commands) - start > 1:
+            self._fixedRanges.append((start, len(self._commands)))
+
+    ## pathOrder does not move commands across this point
+    #
+    # All commands drawn before are written before all commands drawn after.
+    def orderBarrier(self):
+        self._barriers.append(len(self._commands))
+
+    ## Write commands to outputs after proximity correction and pathOrder
+    def _writeBuffered(self):
+        rows = self._commands.toArray()
+        if self._proximity is not None:
+            rows = self._proximity.correct(rows, self._doseTimeMin, self._doseTimeMax)
+        if self._pathOrder is not None:
+            rows = rows[self._pathOrder.order(rows, self._fixedRanges, self._barriers)]
+        chunkSize = 1 << 16
+        for start in range(0, len(rows), chunkSize):
+            self._output.extend(rows[start : start + chunkSize])
+
+    ## Size (width, height) of area used by createPatterns (nm)
+    def _drawingArea(self):
+        return self._patchSize, self._patchSize
+
+    ## Pass new commands to exposure time estimator
+    def _estimate(self, rows):
+        self._estimator.commands(rows, self._layout)
+
     ## Outpus log to both screen and log file
     def _log(self, info):
         print(info)
         self._logFile.write("%s\r\n" % info)
 
     ## Check if position (x, y) is out of bounds of patch.
+    #
+    # Also works element-wise for NumPy arrays.
     def _out_bounds(self, x, y):
-        return x < 0 or x > self._patchSize or y < 0 or y > self._patchSize
+        return (x < 0) | (x > self._patchSize) | (y < 0) | (y > self._patchSize)
 
     ## Check if dose time is not within EB machine limit.
+    #
+    # Also works element-wise for NumPy arrays.
     def _out_dose(self, doseTime):
-        return doseTime < self._doseTimeMin or doseTime > self._doseTimeMax
+        return (
+            ~np.isfinite(doseTime) | (doseTime < self._doseTimeMin) | (doseTime > self._doseTimeMax)
+        )
+
+    ## Split a batch of shapes into rounded coordinates and dose times.
+    #
+    # @param shapes Array of N x (nCoord + 1) [coordinates..., doseTime],
+    #               or N x nCoord when doseTime is given
+    #               (a single shape may be given as 1-D array)
+    # @param nCoord Number of coordinate columns
+    # @param doseTime Dose time used for all shapes (μsec.), or None
+    # @return (rounded coordinates (nm), dose times), both float arrays
+    def _batch(self, shapes, nCoord, doseTime):
+        shapes = np.asarray(shapes, dtype=float)
+        width = nCoord + 1 if doseTime is None else nCoord
+        if shapes.ndim == 1 and shapes.size in (0, width):
+            shapes = shapes.reshape(-1, width)  # Single shape (or none)
+        if shapes.ndim != 2 or shapes.shape[1] != width:
+            raise ValueError(
+                "Shapes must be N x %d%s, got shape %s"
+                % (width, "" if doseTime is None else " with doseTime", shapes.shape)
+            )
+        if doseTime is None:
+            dose = shapes[:, nCoord]
+        else:
+            dose = np.full(len(shapes), float(doseTime))
+        # Round all coordinates to units of 10 nm (same as round() in scalar path)
+        pos = np.rint(shapes[:, :nCoord] / self._unit) * self._unit
+        return pos, dose
 
     ## Draw straight line
     #
@@ -104,19 +538,15 @@ class CC6Writer:
         else:
             self._commandCount += 1
 
-            # Draw line in CC6
-            self._cc6File.write(
-                "DWLL(%d,%d,%d,%d,%.1f) ;3\r\n"
-                % (
-                    (sX / self._unit),
-                    (self._patchSize - sY) / self._unit,
-                    eX / self._unit,
-                    (self._patchSize - eY) / self._unit,
-                    doseTime,
-                )
+            # Draw line (CC6 coordinates, y is flipped)
+            self._commands.append(
+                DWLL,
+                int(sX / self._unit),
+                int((self._patchSize - sY) / self._unit),
+                int(eX / self._unit),
+                int((self._patchSize - eY) / self._unit),
+                doseTime,
             )
-            # Draw line in dxf
-            self._drawing.add(dxf.line((sX, sY), (eX, eY), color=7))
 
     def drawlineSquare(self, startX, startY, endX, endY, doseTime):
         # Round all coordinates to units of 10 nm
@@ -143,56 +573,15 @@ class CC6Writer:
             if eY > sY:
                 sY, eY = eY, sY
 
-            # Draw rectangle in CC6
-            self._cc6File.write(
-                "DWLL(%d,%d,%d,%d,%.1f) ;3\r\n"
-                % (
-                    (sX / self._unit),
-                    (self._patchSize - sY) / self._unit,
-                    eX / self._unit,
-                    (self._patchSize - sY) / self._unit,
-                    doseTime,
-                )
-            )
-            self._cc6File.write(
-                "DWLL(%d,%d,%d,%d,%.1f) ;3\r\n"
-                % (
-                    (sX / self._unit),
-                    (self._patchSize - eY) / self._unit,
-                    eX / self._unit,
-                    (self._patchSize - eY) / self._unit,
-                    doseTime,
-                )
-            )
-            self._cc6File.write(
-                "DWLL(%d,%d,%d,%d,%.1f) ;3\r\n"
-                % (
-                    (sX / self._unit),
-                    (self._patchSize - sY) / self._unit,
-                    sX / self._unit,
-                    (self._patchSize - eY) / self._unit,
-                    doseTime,
-                )
-            )
-            self._cc6File.write(
-                "DWLL(%d,%d,%d,%d,%.1f) ;3\r\n"
-                % (
-                    (eX / self._unit),
-                    (self._patchSize - sY) / self._unit,
-                    eX / self._unit,
-                    (self._patchSize - eY) / self._unit,
-                    doseTime,
-                )
-            )
-
-            # Draw rectange in dxf
-            self._drawing.add(dxf.line((sX, sY), (eX, sY), color=7))
-            self._drawing.add(dxf.line((sX, eY), (eX, eY), color=7))
-            self._drawing.add(dxf.line((sX, sY), (sX, eY), color=7))
-            self._drawing.add(dxf.line((eX, sY), (eX, eY), color=7))
-            # polyline = dxf.polyline()
-            # polyline.add_vertices([(sX, sY), (eX, sY), (eX, eY), (sX, eY), (sX, sY)])
-            # self._drawing.add(polyline)
+            # Draw rectangle as four lines (CC6 coordinates, y is flipped)
+            left = int(sX / self._unit)
+            right = int(eX / self._unit)
+            top = int((self._patchSize - sY) / self._unit)
+            bottom = int((self._patchSize - eY) / self._unit)
+            self._commands.append(DWLL, left, top, right, top, doseTime)
+            self._commands.append(DWLL, left, bottom, right, bottom, doseTime)
+            self._commands.append(DWLL, left, top, left, bottom, doseTime)
+            self._commands.append(DWLL, right, top, right, bottom, doseTime)
 
     ## Draw rectangle
     #
@@ -226,24 +615,16 @@ class CC6Writer:
             if eY > sY:
                 sY, eY = eY, sY
 
-            # Draw rectangle in CC6
-            self._cc6File.write(
-                "DWSL(%d,%d,%d,%d,%d,%.1f) ;3\r\n"
-                % (
-                    (sX / self._unit),
-                    (self._patchSize - sY) / self._unit,
-                    eX / self._unit,
-                    (self._patchSize - eY) / self._unit,
-                    1,
-                    doseTime,
-                )
+            # Draw rectangle (CC6 coordinates, y is flipped)
+            self._commands.append(
+                DWSL,
+                int(sX / self._unit),
+                int((self._patchSize - sY) / self._unit),
+                int(eX / self._unit),
+                int((self._patchSize - eY) / self._unit),
+                doseTime,
             )
 
-            # Draw rectange in dxf
-            polyline = dxf.polyline()
-            polyline.add_vertices([(sX, sY), (eX, sY), (eX, eY), (sX, eY), (sX, sY)])
-            self._drawing.add(polyline)
-
     ## Draw single spot
     #
     # @param pX Position x (nm)
@@ -257,18 +638,135 @@ class CC6Writer:
             self._errorCount += 1
         else:
             self._commandCount += 1
-            # Draw spot in CC6
-            self._cc6File.write(
-                "DWSPS(%d,%d,10,%.1f) ;2\r\n"
-                % ((aX / self._unit), (aY / self._unit), doseTime)
+            # Draw spot (CC6 coordinates, y is not flipped for spots)
+            self._commands.append(
+                DWSPS, int(aX / self._unit), int(aY / self._unit), 0, 0, doseTime
             )
 
-            # In DXF, draw as circle with cross mark
-            circle = dxf.circle(5, (aX, aY))
-            line_h = dxf.line((aX - 5, aY), (aX + 5, aY))
-            line_v = dxf.line((aX, aY - 5), (aX, aY + 5))
-            for item in (circle, line_h, line_v):
-                self._drawing.add(item)
+    ## Draw many straight lines at once
+    #
+    # Same result as calling drawLine for each row, but rounding and error
+    # check are done on whole arrays and all commands are added in one go.
+    # @param lines Array of N x 5 [startX, startY, endX, endY, doseTime] (nm, μsec.),
+    #              or N x 4 without doseTime
+    # @param doseTime Dose time per unit length for all lines (μsec.)
+    def drawLines(self, lines, doseTime=None):
+        pos, dose = self._batch(lines, 4, doseTime)
+        sX, sY, eX, eY = pos.T
+        # Line should not have same start and end position
+        err = (
+            self._out_dose(dose)
+            | self._out_bounds(sX, sY)
+            | self._out_bounds(eX, eY)
+            | ((sX == eX) & (sY == eY))
+        )
+        ok = ~err
+        self._errorCount += int(np.count_nonzero(err))
+        self._commandCount += int(np.count_nonzero(ok))
+        sX, sY, eX, eY, dose = sX[ok], sY[ok], eX[ok], eY[ok], dose[ok]
+
+        # Draw lines (CC6 coordinates, y is flipped)
+        self._commands.extend(
+            makeCommands(
+                DWLL,
+                sX / self._unit,
+                (self._patchSize - sY) / self._unit,
+                eX / self._unit,
+                (self._patchSize - eY) / self._unit,
+                dose,
+            )
+        )
+
+    ## Draw many rectangles at once
+    #
+    # Same result as calling drawSquare for each row (see drawLines).
+    # @param squares Array of N x 5 [startX, startY, endX, endY, doseTime] (nm, μsec.),
+    #                or N x 4 without doseTime
+    # @param doseTime Dose time for all rectangles (μsec.)
+    def drawSquares(self, squares, doseTime=None):
+        pos, dose = self._batch(squares, 4, doseTime)
+        sX, sY, eX, eY = pos.T
+        err = (
+            self._out_dose(dose)
+            | self._out_bounds(sX, sY)
+            | self._out_bounds(eX, eY)
+            | ((sX == eX) | (sY == eY))
+        )
+        ok = ~err
+        self._errorCount += int(np.count_nonzero(err))
+        self._commandCount += int(np.count_nonzero(ok))
+        sX, sY, eX, eY, dose = sX[ok], sY[ok], eX[ok], eY[ok], dose[ok]
+        # sX on left side, sY on top side
+        sX, eX = np.minimum(sX, eX), np.maximum(sX, eX)
+        sY, eY = np.maximum(sY, eY), np.minimum(sY, eY)
+
+        # Draw rectangles (CC6 coordinates, y is flipped)
+        self._commands.extend(
+            makeCommands(
+                DWSL,
+                sX / self._unit,
+                (self._patchSize - sY) / self._unit,
+                eX / self._unit,
+                (self._patchSize - eY) / self._unit,
+                dose,
+            )
+        )
+
+    ## Draw many rectangles as four lines at once
+    #
+    # Same result as calling drawlineSquare for each row (see drawLines).
+    # @param squares Array of N x 5 [startX, startY, endX, endY, doseTime]
+    #                (nm, μsec.), or N x 4 without doseTime
+    # @param doseTime Dose time per unit length for all rectangles (μsec.)
+    def drawlineSquares(self, squares, doseTime=None):
+        pos, dose = self._batch(squares, 4, doseTime)
+        sX, sY, eX, eY = pos.T
+        err = (
+            self._out_dose(dose)
+            | self._out_bounds(sX, sY)
+            | self._out_bounds(eX, eY)
+            | ((sX == eX) | (sY == eY))
+        )
+        ok = ~err
+        self._errorCount += int(np.count_nonzero(err))
+        self._commandCount += int(np.count_nonzero(ok))
+        sX, sY, eX, eY, dose = sX[ok], sY[ok], eX[ok], eY[ok], dose[ok]
+        left = np.minimum(sX, eX) / self._unit
+        right = np.maximum(sX, eX) / self._unit
+        top = (self._patchSize - np.maximum(sY, eY)) / self._unit
+        bottom = (self._patchSize - np.minimum(sY, eY)) / self._unit
+
+        # Top, bottom, left and right line of each rectangle in turn
+        lines = np.stack(
+            (
+                (left, top, right, top),
+                (left, bottom, right, bottom),
+                (left, top, left, bottom),
+                (right, top, right, bottom),
+            ),
+            axis=2,
+        ).reshape(4, -1)
+        self._commands.extend(makeCommands(DWLL, *lines, np.repeat(dose, 4)))
+
+    ## Draw many single spots at once
+    #
+    # Same result as calling drawSpot for each row (see drawLines).
+    # @param spots Array of N x 3 [pX, pY, doseTime] (nm, μsec.),
+    #              or N x 2 without doseTime
+    # @param doseTime Dose time for all spots (μsec.)
+    def drawSpots(self, spots, doseTime=None):
+        pos, dose = self._batch(spots, 2, doseTime)
+        aX, aY = pos.T
+        err = self._out_dose(dose) | self._out_bounds(aX, aY)
+        ok = ~err
+        self._errorCount += int(np.count_nonzero(err))
+        self._commandCount += int(np.count_nonzero(ok))
+        aX, aY, dose = aX[ok], aY[ok], dose[ok]
+
+        # Draw spots (CC6 coordinates, y is not flipped for spots)
+        self._commands.extend(
+            makeCommands(DWSPS, aX / self._unit, aY / self._unit, 0, 0, dose)
+        )
 
     ## Draw chip marker (four thick lines on each side)
     #
@@ -298,248 +796,77 @@ class CC6Writer:
 
     ## Draw 10 bit marker assignment
     #
+    # Each digit encodes 5 bits of x and y. Digit k is drawn 8/7 size
+    # below digit 0; digit 0 has two fix bits, higher digits only the left one.
     # @param x The x number of marker
     # @param y The y number of marker
     # @param centerX Marker position x (nm)
     # @param centerY Marker position y (nm)
     # @param doseTime Dose time (μsec.)
     # @param size Width of lines in marker (nm)
-    def draw10BitMarker(self, x, y, centerX, centerY, doseTime=1.0, size=1400):
-        width = size / 7.0
-        # Fix bit
-        self.drawSquare(
-            -2.5 * width + centerX,
-            2.5 * width + centerY,
-            -0.5 * width + centerX,
-            3.5 * width + centerY,
-            doseTime,
-        )
-        self.drawSquare(
-            0.5 * width + centerX,
-            2.5 * width + centerY,
-            2.5 * width + centerX,
-            3.5 * width + centerY,
-            doseTime,
-        )
-
-        # x(1)
-        if x & 1 == 1:
-            self.drawSquare(
-                -3.5 * width + centerX,
-                0.5 * width + centerY,
-                -2.5 * width + centerX,
-                2.5 * width + centerY,
-                doseTime,
-            )
-
-        # x(2)
-        if x & 2 == 2:
-            self.drawSquare(
-                -2.5 * width + centerX,
-                -0.5 * width + centerY,
-                -0.5 * width + centerX,
-                0.5 * width + centerY,
-                doseTime,
-            )
-        # x(4)
-        if x & 4 == 4:
-            self.drawSquare(
-                -0.5 * width + centerX,
-                0.5 * width + centerY,
-                0.5 * width + centerX,
-                2.5 * width + centerY,
-                doseTime,
-            )
-
-        # x(8)
-        if x & 8 == 8:
-            self.drawSquare(
-                0.5 * width + centerX,
-                -0.5 * width + centerY,
-                2.5 * width + centerX,
-                0.5 * width + centerY,
-                doseTime,
-            )
-
-        # x(16)
-        if x & 16 == 16:
-            self.drawSquare(
-                2.5 * width + centerX,
-                0.5 * width + centerY,
-                3.5 * width + centerX,
-                2.5 * width + centerY,
-                doseTime,
-            )
-
-        # y(1)
-        if y & 1 == 1:
-            self.drawSquare(
-                -3.5 * width + centerX,
-                -2.5 * width + centerY,
-                -2.5 * width + centerX,
-                -0.5 * width + centerY,
-                doseTime,
-            )
-
-        # y(2)
-        if y & 2 == 2:
-            self.drawSquare(
-                -2.5 * width + centerX,
-                -3.5 * width + centerY,
-                -0.5 * width + centerX,
-                -2.5 * width + centerY,
-                doseTime,
-            )
-        # y(4)
-        if y & 4 == 4:
-            self.drawSquare(
-                -0.5 * width + centerX,
-                -2.5 * width + centerY,
-                0.5 * width + centerX,
-                -0.5 * width + centerY,
-                doseTime,
-            )
-
-        # y(8)
-        if y & 8 == 8:
-            self.drawSquare(
-                0.5 * width + centerX,
-                -3.5 * width + centerY,
-                2.5 * width + centerX,
-                -2.5 * width + centerY,
-                doseTime,
-            )
+    # @param digits Number of digits (x and y below 32 ** digits)
+    def draw10BitMarker(self, x, y, centerX, centerY, doseTime=1.0, size=1400, digits=1):
+        self.drawSquares(self._markerRects(x, y, centerX, centerY, size, digits), doseTime)
 
-        # y(16)
-        if y & 16 == 16:
-            self.drawSquare(
-                2.5 * width + centerX,
-                -2.5 * width + centerY,
-                3.5 * width + centerX,
-                -0.5 * width + centerY,
-                doseTime,
-            )
-
-    def draw10BitLineMarker(self, x, y, centerX, centerY, doseTime=1.0, size=140000):
-        width = size / 7.0
-        # Fix bit
-        self.drawlineSquare(
-            -2.5 * width + centerX,
-            2.5 * width + centerY,
-            -0.5 * width + centerX,
-            3.5 * width + centerY,
-            doseTime,
-        )
-        self.drawlineSquare(
-            0.5 * width + centerX,
-            2.5 * width + centerY,
-            2.5 * width + centerX,
-            3.5 * width + centerY,
-            doseTime,
+    ## Draw 10 bit marker with rectangle outlines (see draw10BitMarker)
+    def draw10BitLineMarker(
+        self, x, y, centerX, centerY, doseTime=1.0, size=140000, digits=1
+    ):
+        self.drawlineSquares(
+            self._markerRects(x, y, centerX, centerY, size, digits), doseTime
         )
 
-        # x(1)
-        if x & 1 == 1:
-            self.drawlineSquare(
-                -3.5 * width + centerX,
-                0.5 * width + centerY,
-                -2.5 * width + centerX,
-                2.5 * width + centerY,
-                doseTime,
-            )
-
-        # x(2)
-        if x & 2 == 2:
-            self.drawlineSquare(
-                -2.5 * width + centerX,
-                -0.5 * width + centerY,
-                -0.5 * width + centerX,
-                0.5 * width + centerY,
-                doseTime,
-            )
-        # x(4)
-        if x & 4 == 4:
-            self.drawlineSquare(
-                -0.5 * width + centerX,
-                0.5 * width + centerY,
-                0.5 * width + centerX,
-                2.5 * width + centerY,
-                doseTime,
-            )
-
-        # x(8)
-        if x & 8 == 8:
-            self.drawlineSquare(
-                0.5 * width + centerX,
-                -0.5 * width + centerY,
-                2.5 * width + centerX,
-                0.5 * width + centerY,
-                doseTime,
-            )
-
-        # x(16)
-        if x & 16 == 16:
-            self.drawlineSquare(
-                2.5 * width + centerX,
-                0.5 * width + centerY,
-                3.5 * width + centerX,
-                2.5 * width + centerY,
-                doseTime,
-            )
-
-        # y(1)
-        if y & 1 == 1:
-            self.drawlineSquare(
-                -3.5 * width + centerX,
-                -2.5 * width + centerY,
-                -2.5 * width + centerX,
-                -0.5 * width + centerY,
-                doseTime,
-            )
-
-        # y(2)
-        if y & 2 == 2:
-            self.drawlineSquare(
-                -2.5 * width + centerX,
-                -3.5 * width + centerY,
-                -0.5 * width + centerX,
-                -2.5 * width + centerY,
-                doseTime,
+    ## Rectangles (nm) of 10 bit marker (x, y) at center
+    def _markerRects(self, x, y, centerX, centerY, size, digits):
+        if not (0 <= x < 32**digits and 0 <= y < 32**digits):
+            raise ValueError(
+                "10 bit marker (%d, %d) needs more than %d digits" % (x, y, digits)
             )
-        # y(4)
-        if y & 4 == 4:
-            self.drawlineSquare(
-                -0.5 * width + centerX,
-                -2.5 * width + centerY,
-                0.5 * width + centerX,
-                -0.5 * width + centerY,
-                doseTime,
-            )
-
-        # y(8)
-        if y & 8 == 8:
-            self.drawlineSquare(
-                0.5 * width + centerX,
-                -3.5 * width + centerY,
-                2.5 * width + centerX,
-                -2.5 * width + centerY,
-                doseTime,
+        rects, counts = self._markerGlyph(size)
+        width = size / 7.0
+        parts = []
+        for digit in range(digits):
+            kind = min(digit, 1)
+            dx = (x >> (_MARKER_BITS * digit)) & 31
+            dy = (y >> (_MARKER_BITS * digit)) & 31
+            digitY = centerY - digit * 8 * width
+            parts.append(
+                rects[kind, dx, dy, : counts[kind, dx, dy]]
+                + (centerX, digitY, centerX, digitY)
             )
+        return np.concatenate(parts)
 
-        # y(16)
-        if y & 16 == 16:
-            self.drawlineSquare(
-                2.5 * width + centerX,
-                -2.5 * width + centerY,
-                3.5 * width + centerX,
-                -0.5 * width + centerY,
-                doseTime,
-            )
+    ## Glyph table of 10 bit marker digits, made once per size
+    #
+    # @return (rects, counts): rectangles of digit (dx, dy) relative to its
+    #         center (nm) are rects[kind, dx, dy, :counts[kind, dx, dy]],
+    #         kind 0 for first digit, 1 for higher digits.
+    def _markerGlyph(self, size):
+        if size not in self._markerGlyphs:
+            width = size / 7.0
+            maxRects = len(_MARKER_FIX) + 2 * _MARKER_BITS
+            rects = np.zeros((2, 32, 32, maxRects, 4))
+            counts = np.zeros((2, 32, 32), int)
+            for kind, fix in enumerate((_MARKER_FIX, _MARKER_FIX[:1])):
+                for dx in range(32):
+                    for dy in range(32):
+                        glyph = (
+                            list(fix)
+                            + [r for b, r in enumerate(_MARKER_X_BITS) if dx >> b & 1]
+                            + [r for b, r in enumerate(_MARKER_Y_BITS) if dy >> b & 1]
+                        )
+                        rects[kind, dx, dy, : len(glyph)] = np.array(glyph) * width
+                        counts[kind, dx, dy] = len(glyph)
+            self._markerGlyphs[size] = (rects, counts)
+        return self._markerGlyphs[size]
 
     ## Create patterns in two levels.
     #
     # This function will call myShape for each pattern.
     # Level 2 patterns have 10 bit markers.
+    # With useTemplate=True, myShape is not called. Instead, the dots from
+    # myShapeParams / myShapeDots are computed once for each distinct set of
+    # parameters (dose is applied separately) and translated to each pattern.
     # @param lv1xnum Level 1 x count
     # @param lv1ynum Level 1 y count
     # @param lv2xnum Level 2 x count
@@ -547,6 +874,12 @@ class CC6Writer:
     # @param lv1width Width of level 1 (nm)
     # @param lv1height Height of level 1 (nm)
     # @param size10BitMarker Width of 10 bit marker line (nm)
+    # @param useTemplate Use cached shape templates instead of myShape
+    # @param markerDigits Digits of 10 bit markers (see draw10BitMarker),
+    #                     default is enough for lv2xnum and lv2ynum
+    # @param workers Number of processes drawing level 2 blocks in parallel.
+    #                Blocks are merged in the same order, so the output is
+    #                same as with one process.
     def createPatterns(
         self,
         lv1xnum,
@@ -557,37 +890,172 @@ class CC6Writer:
         lv1height,
         dose_time=3.0,
         size10BitMarker=1400,
+        useTemplate=False,
+        markerDigits=None,
+        workers=1,
     ):
-        # Calculate level 2 size
-        lv2width = size10BitMarker * 2.0 + lv1width * (lv1xnum)
-        lv2height = size10BitMarker * 2.0 + lv1height * (lv1ynum)
+        layout = PatternLayout(
+            lv1xnum,
+            lv1ynum,
+            lv2xnum,
+            lv2ynum,
+            lv1width,
+            lv1height,
+            size10BitMarker,
+            self._drawingArea(),
+        )
+        self._layout = layout
+        if markerDigits is None:
+            markerDigits = 1
+            while max(lv2xnum, lv2ynum) > 32**markerDigits:
+                markerDigits += 1
+
+        jobs = [
+            (lv2x, lv2y, dose_time, size10BitMarker, useTemplate, markerDigits)
+            for lv2y in range(lv2ynum)
+            for lv2x in range(lv2xnum)
+        ]
+        if self._cache is not None:
+            self._createCachedBlocks(jobs, workers)
+            return
+        if workers <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                self._createBlock(*job)
+            return
+
+        chunkSize = max(1, len(jobs) // (4 * workers))
+        with multiprocessing.Pool(
+            workers, _blockInit, (type(self), self._blockState())
+        ) as pool:
+            for block, text in pool.imap(_blockWorker, jobs, chunkSize):
+                print(text, end="")
+                self._mergeBlock(block)
+
+    ## Draw blocks of createPatterns not found in cache, reuse the others
+    def _createCachedBlocks(self, jobs, workers):
+        cache = self._cache
+        keys = [cache.key(self, job) for job in jobs]
+        blocks = [cache.load(key) for key in keys]
+        missing = [job for job, block in zip(jobs, blocks) if block is None]
+        with contextlib.ExitStack() as stack:
+            if workers > 1 and len(missing) > 1:
+                pool = stack.enter_context(
+                    multiprocessing.Pool(workers, _blockInit, (type(self), self._blockState()))
+                )
+                drawn = pool.imap(_blockWorker, missing, max(1, len(missing) // (4 * workers)))
+            else:
+                writer = type(self).__new__(type(self))
+                writer.__dict__.update(self._blockState())
+                drawn = (_runBlock(writer, job) for job in missing)
+            for key, block in zip(keys, blocks):
+                if block is None:
+                    block = next(drawn)
+                    cache.store(key, block)
+                block, text = block
+                print(text, end="")
+                self._mergeBlock(block)
+
+    ## Inputs of _createBlock besides its arguments (see eb_cache.JobCache)
+    def _cacheInputs(self):
+        return (
+            type(self).__module__,
+            type(self).__name__,
+            self._unit,
+            self._patchSize,
+            self._doseTimeMin,
+            self._doseTimeMax,
+            sorted(self._shapeBase.items()),
+            sorted(vars(self._layout).items()),
+        )
 
-        # Total Size
-        totalWidth = lv2width * lv2xnum
-        totalHeight = lv2height * lv2ynum
+    ## Draw one level 2 block of createPatterns (patterns and 10 bit marker)
+    def _createBlock(
+        self, lv2x, lv2y, dose_time, size10BitMarker, useTemplate, markerDigits
+    ):
+        layout = self._layout
+        lines = []
+        for lv1y in range(layout.lv1ynum):
+            for lv1x in range(layout.lv1xnum):
+                cx, cy = layout.center(lv1x, lv1y, lv2x, lv2y)
+                if useTemplate:
+                    lines.append(
+                        self.shapeTemplate(lv1x, lv1y, lv2x, lv2y)
+                        + (cx, cy, cx, cy, 0)
+                    )
+                else:
+                    self.myShape(cx, cy, lv1x, lv1y, lv2x, lv2y)
+        if lines:
+            self.drawLines(np.concatenate(lines))
+
+        markerX, markerY = layout.markerCenter(lv2x, lv2y)
+        self.draw10BitMarker(
+            lv2x,
+            lv2y,
+            markerX,
+            markerY,
+            dose_time,
+            size=size10BitMarker,
+            digits=markerDigits,
+        )
 
-        # Initial position of level 2
-        lv2inix = (self._patchSize - totalWidth) / 2.0
-        lv2iniy = (self._patchSize - totalHeight) / 2.0
-
-        for lv2y in range(lv2ynum):
-            for lv2x in range(lv2xnum):
-                lv1inix = lv2inix + lv2x * lv2width + size10BitMarker * 2.0
-                lv1iniy = lv2iniy + lv2y * lv2height
-                for lv1y in range(lv1ynum):
-                    for lv1x in range(lv1xnum):
-                        cx = lv1inix + lv1width * (lv1x + 0.5)
-                        cy = lv1iniy + lv1height * (lv1y + 0.5)
-                        self.myShape(cx, cy, lv1x, lv1y, lv2x, lv2y)
-
-                self.draw10BitMarker(
-                    lv2x,
-                    lv2y,
-                    lv1inix - size10BitMarker,
-                    lv1iniy + size10BitMarker + lv1ynum * lv1height,
-                    dose_time,
-                    size=size10BitMarker,
-                )
+    ## Copy of writer state for createPatterns worker processes
+    #
+    # Open files and outputs stay in this process, workers draw into
+    # an own CommandTable.
+    def _blockState(self):
+        # Public names are timed methods of profile, they stay here
+        state = dict(
+            (key, value)
+            for key, value in self.__dict__.items()
+            if key.startswith("_")
+            and key
+            not in (
+                "_cc6File",
+                "_cc6",
+                "_preview",
+                "_estimator",
+                "_pathOrder",
+                "_proximity",
+                "_checker",
+                "_hierarchy",
+                "_cache",
+                "_profile",
+                "_output",
+                "_logFile",
+            )
+        )
+        state["_commands"] = CommandTable()
+        state["_commandCount"] = 0
+        state["_errorCount"] = 0
+        state["_fixedRanges"] = []
+        state["_barriers"] = []
+        return state
+
+    ## Take commands drawn by worker since last call
+    def _takeBlock(self):
+        block = (
+            self._commands.toArray(),
+            self._commandCount,
+            self._errorCount,
+            self._fixedRanges,
+            self._barriers,
+        )
+        self._commands = CommandTable()
+        self._commandCount = 0
+        self._errorCount = 0
+        self._fixedRanges = []
+        self._barriers = []
+        return block
+
+    ## Add commands drawn by worker (see _takeBlock)
+    def _mergeBlock(self, block):
+        rows, commandCount, errorCount, fixedRanges, barriers = block
+        offset = len(self._commands)
+        self._commands.extend(rows)
+        self._commandCount += commandCount
+        self._errorCount += errorCount
+        self._fixedRanges += [(start + offset, end + offset) for start, end in fixedRanges]
+        self._barriers += [index + offset for index in barriers]
 
     ## Create patterns for MOKE sample
     #
@@ -595,8 +1063,9 @@ class CC6Writer:
     # @param lv1width Width of level 1 (nm)
     # @param lv1height Height of level 1 (nm)
     def createMOKEpattern(self, lv1width, lv1height):
-        lv1xnum = int(self._patchSize / lv1width)
-        lv1ynum = int(self._patchSize / lv1height)
+        width, height = self._drawingArea()
+        lv1xnum = int(width / lv1width)
+        lv1ynum = int(height / lv1height)
         self.createPatterns(
             lv1xnum, lv1ynum, 1, 1, lv1width, lv1height, size10BitMarker=0
         )
@@ -655,14 +1124,7 @@ class CC6Writer:
     # @param cx Center x
     # @param cy Center y
     def drawDot(self, cx, cy):
-        for i in range(len(self._dotData)):
-            self.drawLine(
-                self._dotData[i, 2] + cx,
-                self._dotData[i, 3] + cy,
-                self._dotData[i, 4] + cx,
-                self._dotData[i, 5] + cy,
-                self._dotData[i, 6],
-            )
+        self.drawLines(self._dotData[:, 2:7] + (cx, cy, cx, cy, 0))
 
     ## Stigma checker pattern
     #
@@ -691,15 +1153,58 @@ class CC6Writer:
 
     ## Placeholder function for use in createPatterns
     def myShape(self, cx, cy, lv1x, lv1y, lv2x, lv2y):
-        Nbit = 8 #bit数,下のiと数を合わせる必要がある
-        dose = 50 #最初のdose
-        dis = 90 #dot間距離
-        length = 65 + 5 * lv1y #データdotとバッファdot長さ
+        params = self.myShapeParams(lv1x, lv1y, lv2x, lv2y)
+        print(params["dose"])
+        self.myShapeDots(params)
+        self.drawDot(cx, cy)
+
+    ## Parameters of myShape for one level 1 pattern
+    #
+    # Everything in myShape that changes with lv1x/lv1y/lv2x/lv2y is here.
+    # @return dict of parameters for myShapeDots
+    def myShapeParams(self, lv1x, lv1y, lv2x, lv2y):
+        base = self._shapeBase #定数はsetShapeBaseで変える
+        Nbit = base["Nbit"] #bit数
+        dose = base["dose"] #最初のdose
+        dis = base["dis"] #dot間距離
+        length = base["length"] + 5 * lv1y #データdotとバッファdot長さ
+
+        p = base["p"] #最初のdotの角度
+        pdb = base["pdb"] + 2 * lv2x  #datadotのoffsetangleを-90からどれくらい起こすか
+        pbd = base["pbd"] - 2 * lv2y #bufferdotのoffsetangleを-90からどれくらい起こすか
+
+        return dict(
+            Nbit=Nbit,
+            dose=dose + 2 * lv1x,  # 全dot共通のdose
+            dis=dis,
+            length=length,
+            p=p,
+            pdb=pdb,
+            pbd=pbd,
+        )
 
-        p = 4 #最初のdotの角度
+    ## Set constants of myShapeParams
+    #
+    # Values for lv1x = lv1y = lv2x = lv2y = 0, e.g. setShapeBase(dose=40, dis=80).
+    # @param Nbit, dose, dis, length, p, pdb, pbd See myShapeParams
+    def setShapeBase(self, **params):
+        unknown = set(params) - set(self._shapeBase)
+        if unknown:
+            raise ValueError("Unknown myShape parameters: %s" % ", ".join(sorted(unknown)))
+        self._shapeBase.update(params)
+
+    ## Set dots of myShape (setDotNum / setDot) from its parameters
+    #
+    # @param params dict from myShapeParams
+    def myShapeDots(self, params):
+        Nbit = params["Nbit"]
+        dose = params["dose"]
+        dis = params["dis"]
+        length = params["length"]
+        p = params["p"]
+        pdb = params["pdb"]
+        pbd = params["pbd"]
         D = 1.4 
-        pdb = 90 + 2 * lv2x  #datadotのoffsetangleを-90からどれくらい起こすか
-        pbd = 4 - 2 * lv2y #bufferdotのoffsetangleを-90からどれくらい起こすか
 
         db = -(90 - pdb) #datadotのoffsetangle
         bd = -(90 - pbd) #bufferdotのoffsetangle
@@ -709,15 +1214,14 @@ class CC6Writer:
         # Fix dot　最初のdot
         Fset = 200
         Flen = 160
-        Fdose = dose + 2 * lv1x
+        Fdose = dose
         Foffset = Flen + dis
         # Foffset = Flen + Flen / 2 * (D - 1)
-        print(Fdose)
 
         # Data dot どっち?
         Dset = 100
         Dlen = length #+ 5*lv2x #lv2xごとにdot長さを5あげる
-        Ddose = dose + 2 * lv1x
+        Ddose = dose
         # Doffset = Dlen * np.cos(22.5 * np.pi / 180) + 10 + 5 * lv1x
         # Doffset = Dlen * D + 5 * lv2x
         Doffset = Dlen + dis
@@ -725,7 +1229,7 @@ class CC6Writer:
         # BufferDot どっち？
         Bset = 100
         Blen = length #+ 5*lv2x #lv2xごとにdot長さを5あげる
-        Bdose = dose + 2 * lv1x
+        Bdose = dose
         #Boffset = Blen * D
         Boffset = Blen + dis
 
@@ -734,7 +1238,7 @@ class CC6Writer:
         self.setOrigin(0, 0, 0) #原点?
         self.setDot(0, 0, 0, 0, Flen, dp, Fdose)
         self.setDot(0, 1, Foffset * 0.5 + Doffset * 0.5, db + 3, Dlen, bp, Ddose)
-        for i in range(8): #Nbitの回数for,上のNbitと同じ数である必要がある
+        for i in range(Nbit):
             self.setDot(
                 1 + i * 2, 2 + i * 2, Doffset * 0.5 + Boffset * 0.5, bd, Blen, dp, Bdose #bufferdotについて
             )
@@ -750,7 +1254,31 @@ class CC6Writer:
             # self.setDot(2, 3, Boffset, 0, Blen, 0, Bdose)
         # self.setDot(3, 4, Boffset, 0, Blen, 0, Bdose)
 
-        self.drawDot(cx, cy)
+    ## Dots of myShape relative to the pattern center, from template cache
+    #
+    # Dots are computed by myShapeDots only once for each set of parameters
+    # except dose. All dots of myShape have the pattern dose, so the dose
+    # column of the cached dots is set to the requested dose. Dots with own
+    # doses (e.g. a subclass) are cached for each dose.
+    # @return Array of N x 5 [x1, y1, x2, y2, doseTime] (nm, μsec.)
+    def shapeTemplate(self, lv1x, lv1y, lv2x, lv2y):
+        params = self.myShapeParams(lv1x, lv1y, lv2x, lv2y)
+        dose = params["dose"]
+        key = tuple(sorted((k, v) for k, v in params.items() if k != "dose"))
+        doseKey = key + (("dose", dose),)
+        if key not in self._templates and doseKey not in self._templates:
+            self.myShapeDots(params)
+            lines = self._dotData[:, 2:7].copy()
+            if np.all(lines[:, 4] == dose):
+                self._templates[key] = (lines, dose)
+            else:
+                self._templates[doseKey] = (lines, dose)
+        lines, cachedDose = self._templates.get(key) or self._templates[doseKey]
+        if cachedDose == dose:
+            return lines
+        lines = lines.copy()
+        lines[:, 4] = dose
+        return lines
 
 
 def main():
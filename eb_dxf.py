@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# DXF preview stream: entities of CC6 commands written directly as text
+#このファイルの単位はnm
+
+import io
+
+import numpy as np
+from dxfwrite import DXFEngine as dxf
+from dxfwrite.base import writetags
+
+from eb_cc6 import DWLL, DWSPS, commandPositions
+
+_sections = None  # Parts of empty dxfwrite drawing (see _drawingSections)
+
+
+## Text of an empty dxfwrite drawing, split where blocks and entities go
+#
+#  Taken once from an empty drawing, so sections, tables and the viewport
+#  entity are exactly as written by dxfwrite.
+# @return (head, blocks to entities, end) text
+def _drawingSections():
+    global _sections
+    if _sections is None:
+        drawing = dxf.drawing("empty.dxf")
+        text = io.StringIO()
+        writetags(text, drawing.__dxftags__())
+        text = text.getvalue()
+        blocks = text.index("  0\nENDSEC\n", text.index("  2\nBLOCKS\n"))
+        end = text.rindex("  0\nENDSEC\n")
+        _sections = (text[:blocks], text[blocks:end], text[end:])
+    return _sections
+
+
+## Buffered output stream of dxf entities
+#
+#  Same file as made by dxfwrite with one entity per command
+#  (line with color 7, closed polyline for rectangles, circle with cross
+#  mark for spots, all on layer 0), but formatted from text templates
+#  column-wise, without an object per entity. Memory use does not depend on
+#  the number of commands.
+#  Blocks (for hierarchical files, see eb_hier) are written between
+#  begin(blocks=True) and endBlocks(), before all other entities.
+class DXFStream:
+    # Group codes as written by dxfwrite ("%3d\n%s\n", floats as str())
+    _line = "  0\nLINE\n 62\n7\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n 11\n%r\n 21\n%r\n 31\n0.0\n"
+    _vertex = "  0\nVERTEX\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n"
+    _polyline = (
+        "  0\nPOLYLINE\n  8\n0\n 66\n1\n 10\n0.0\n 20\n0.0\n 30\n0.0\n 70\n8\n"
+        + _vertex * 5
+        + "  0\nSEQEND\n"
+    )
+    _block = "  0\nBLOCK\n  8\n0\n  2\n%s\n  3\n%s\n 70\n0\n 10\n0.0\n 20\n0.0\n 30\n0.0\n"
+    _insert = "  0\nINSERT\n  8\n0\n  2\n%s\n 10\n%r\n 20\n%r\n 30\n0.0\n"
+    _array = " 70\n%d\n 71\n%d\n 44\n%r\n 45\n%r\n"
+    _spot = (
+        "  0\nCIRCLE\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n 40\n5.0\n"
+        "  0\nLINE\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n 11\n%r\n 21\n%r\n 31\n0.0\n"
+        "  0\nLINE\n  8\n0\n 10\n%r\n 20\n%r\n 30\n0.0\n 11\n%r\n 21\n%r\n 31\n0.0\n"
+    )
+
+    ## @param sink Opened file, or any object with write() (e.g. io.StringIO)
+    # @param unit Unit length per EB drawing cell (nm)
+    # @param patchSize Size of single patch (nm), for flipping y back
+    # @param bufferSize Number of characters to collect before writing
+    def __init__(self, sink, unit, patchSize, bufferSize=1 << 20):
+        self._sink = sink
+        self._unit = float(unit)
+        self._patchSize = float(patchSize)
+        self._bufferSize = bufferSize
+        self._buffer = []
+        self._bufferLength = 0
+        self.charCount = 0  # Number of characters written to sink
+
+    ## Write sections before entities
+    #
+    # @param blocks Stop in the blocks section, continue with endBlocks()
+    def begin(self, blocks=False):
+        self.write(_drawingSections()[0])
+        if not blocks:
+            self.endBlocks()
+
+    ## Write start of block definition (entities follow up to endBlock)
+    def beginBlock(self, name):
+        self.write(self._block % (name, name))
+
+    def endBlock(self):
+        self.write("  0\nENDBLK\n")
+
+    ## Write sections after blocks, up to the entities
+    def endBlocks(self):
+        self.write(_drawingSections()[1])
+
+    ## Write end of entities and file, and flush
+    def end(self):
+        self.write(_drawingSections()[2])
+        self.flush()
+
+    ## Add text to buffer, and write out if buffer is full
+    def write(self, text):
+        self._buffer.append(text)
+        self._bufferLength += len(text)
+        if self._bufferLength >= self._bufferSize:
+            self.flush()
+
+    ## Write out buffer to sink
+    def flush(self):
+        if self._buffer:
+            text = "".join(self._buffer)
+            self._sink.write(text)
+            self.charCount += len(text)
+            self._buffer.clear()
+            self._bufferLength = 0
+
+    ## Write entities of CommandTable rows
+    def writeCommands(self, rows):
+        self.writeShapes(rows["op"], *commandPositions(rows, self._unit, self._patchSize))
+
+    ## Write entities of commands at positions (nm, y upwards)
+    #
+    # @param op Opcodes (DWLL, DWSL or DWSPS)
+    # @param x1, y1, x2, y2 Positions as from commandPositions
+    def writeShapes(self, op, x1, y1, x2, y2):
+        # Format each run of same opcode column-wise
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(op)) + 1))
+        ends = np.append(starts[1:], len(op))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            kind = int(op[start])
+            sX, sY, eX, eY = x1[start:end], y1[start:end], x2[start:end], y2[start:end]
+            if kind == DWSPS:
+                columns = (sX, sY, sX - 5, sY, sX + 5, sY, sX, sY - 5, sX, sY + 5)
+                entityFormat = self._spot
+            elif kind == DWLL:
+                columns = (sX, sY, eX, eY)
+                entityFormat = self._line
+            else:
+                columns = (sX, sY, eX, sY, eX, eY, sX, eY, sX, sY)
+                entityFormat = self._polyline
+            columns = [column.tolist() for column in columns]
+            self.write("".join([entityFormat % row for row in zip(*columns)]))
+
+    ## Write reference to block (array of columns x rows if given)
+    #
+    # @param x, y Position of block origin (nm)
+    # @param spacing (column, row) spacing of array (nm)
+    def writeInsert(self, name, x, y, columns=1, rows=1, spacing=(0.0, 0.0)):
+        text = self._insert % (name, float(x), float(y))
+        if columns > 1 or rows > 1:
+            text += self._array % (columns, rows, float(spacing[0]), float(spacing[1]))
+        self.write(text)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Estimates EB exposure time of CC6 jobs
+#
+# Usage: python eb_estimate.py d251031hs.CC6 --layout 10,10,5,5,5000,5000,1400
+
+import argparse
+
+import numpy as np
+
+from eb_cc6 import DWLL, DWSL, DWSPS, CC6Reader, commandPositions
+from eb_dot import PatternLayout
+
+
+## Incremental estimate of exposure time
+#
+#  Give every chunk of commands to commands() while they are generated
+#  (CC6Writer.open(fileName, estimator=ExposureEstimator()) does this).
+#  Only array sums are kept.
+#  - DWLL: dose (per unit length) x line length (cells)
+#  - DWSL: dose x area (cells, both ends included)
+#  - DWSPS: dose
+#  Each command adds settleTime, each field adds fieldMoveTime.
+#  Times of the EB machine are in μsec., results are in sec.
+class ExposureEstimator:
+    ## @param settleTime Beam settling time per command (μsec.)
+    # @param fieldMoveTime Stage move and settling per field (sec.)
+    # @param unit Unit length per EB drawing cell (nm)
+    # @param patchSize Size of single patch (nm)
+    def __init__(self, settleTime=1.0, fieldMoveTime=2.0, unit=5.0, patchSize=300000):
+        self.settleTime = settleTime
+        self.fieldMoveTime = fieldMoveTime
+        self._unit = unit
+        self._patchSize = patchSize
+        self.commandCount = 0
+        self.beamTime = np.zeros(3)  # Beam on time for DWLL, DWSL, DWSPS (μsec.)
+        self.blockTime = {}  # {(lv2x, lv2y): time (μsec.)}, (-1, -1) outside blocks
+
+    ## Add chunk of commands (COMMAND_DTYPE)
+    #
+    # @param layout PatternLayout to sum up time per level 2 block, or None
+    def commands(self, rows, layout=None):
+        op = rows["op"]
+        dx = (rows["x2"] - rows["x1"]).astype(float)
+        dy = (rows["y2"] - rows["y1"]).astype(float)
+        size = np.where(
+            op == DWLL,
+            np.hypot(dx, dy),
+            np.where(op == DWSL, (np.abs(dx) + 1) * (np.abs(dy) + 1), 1.0),
+        )
+        time = rows["dose"] * size
+        self.beamTime += np.bincount(op, weights=time, minlength=3)
+        self.commandCount += len(rows)
+
+        time = time + self.settleTime
+        if layout is None:
+            self.blockTime[(-1, -1)] = self.blockTime.get((-1, -1), 0.0) + time.sum()
+            return
+        x1, y1, x2, y2 = commandPositions(rows, self._unit, self._patchSize)
+        _, _, lv2x, lv2y = layout.locate((x1 + x2) / 2, (y1 + y2) / 2)
+        blocks, index = np.unique(np.stack((lv2x, lv2y), axis=1), axis=0, return_inverse=True)
+        sums = np.bincount(index.ravel(), weights=time, minlength=len(blocks))
+        for block, value in zip(map(tuple, blocks.tolist()), sums.tolist()):
+            self.blockTime[block] = self.blockTime.get(block, 0.0) + value
+
+    ## Total time of this field (sec.), including settling and stage move
+    def fieldTime(self):
+        return (
+            self.beamTime.sum() + self.commandCount * self.settleTime
+        ) * 1e-6 + self.fieldMoveTime
+
+    ## Report as text lines
+    def report(self):
+        lines = [
+            "Beam time DWLL:  %12.3f s" % (self.beamTime[DWLL] * 1e-6),
+            "Beam time DWSL:  %12.3f s" % (self.beamTime[DWSL] * 1e-6),
+            "Beam time DWSPS: %12.3f s" % (self.beamTime[DWSPS] * 1e-6),
+            "Settling:        %12.3f s" % (self.commandCount * self.settleTime * 1e-6),
+            "Field total:     %12.3f s" % self.fieldTime(),
+        ]
+        for block, time in sorted(self.blockTime.items()):
+            if block == (-1, -1):
+                lines.append("  Outside blocks: %10.3f s" % (time * 1e-6))
+            else:
+                lines.append("  Block (%2d,%2d):  %10.3f s" % (block + (time * 1e-6,)))
+        return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate exposure time of CC6 file")
+    parser.add_argument("fileName")
+    parser.add_argument(
+        "--layout",
+        help="createPatterns arguments lv1xnum,lv1ynum,lv2xnum,lv2ynum,"
+        "lv1width,lv1height[,size10BitMarker] to show time per level 2 block",
+    )
+    parser.add_argument("--settle", type=float, default=1.0, help="μsec. per command")
+    parser.add_argument("--move", type=float, default=2.0, help="sec. per field")
+    args = parser.parse_args()
+
+    layout = None
+    if args.layout:
+        values = [float(v) for v in args.layout.split(",")]
+        layout = PatternLayout(*[int(v) for v in values[:4]], *values[4:])
+
+    estimator = ExposureEstimator(args.settle, args.move)
+    for rows in CC6Reader(args.fileName).chunks():
+        estimator.commands(rows, layout)
+    for line in estimator.report():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
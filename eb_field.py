@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Splits layouts larger than one field into CC6 jobs for each field
+#このファイルの単位はnm (stage座標はmm)
+
+import copy
+
+import numpy as np
+
+from eb_dot import CC6Writer
+
+_LINE = 0
+_SQUARE = 1
+_SPOT = 2
+
+
+## Cut line to rectangle (Liang-Barsky)
+#
+# @return (x1, y1, x2, y2) of the part inside, or None
+def _clipLine(x1, y1, x2, y2, left, bottom, right, top):
+    dx = x2 - x1
+    dy = y2 - y1
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x1 - left), (dx, right - x1), (-dy, y1 - bottom), (dy, top - y1)):
+        if p == 0:
+            if q < 0:
+                return None
+        elif p < 0:
+            t0 = max(t0, q / p)
+        else:
+            t1 = min(t1, q / p)
+    if t0 >= t1:
+        return None
+    return x1 + t0 * dx, y1 + t0 * dy, x1 + t1 * dx, y1 + t1 * dy
+
+
+## Writer for layouts of several fields (stitching)
+#
+#  Works like CC6Writer, but the drawing area is fieldsX x fieldsY fields
+#  (nm, y upwards, origin at lower left corner of field (0, 0)), so
+#  createPatterns etc. can place patterns over the whole substrate.
+#  Shapes are collected, and close() writes one CC6 job per field
+#  (fileName_x0_y0, ...) with shapes cut at field borders, and the table
+#  of stage positions of the fields (fileName_fields.txt).
+#  HOWTO:
+#  1. Create class instance: hoge = StitchWriter(3, 2)
+#  2. hoge.open(your_filename_here, stageCenter=(61.1, 38.0))
+#  3. Use the drawing functions of CC6Writer
+#  4. Close the file: hoge.close()
+class StitchWriter(CC6Writer):
+    ## @param fieldsX Number of fields in x
+    # @param fieldsY Number of fields in y
+    # @param writerClass Class of the writers for each field
+    def __init__(self, fieldsX, fieldsY, writerClass=CC6Writer):
+        super().__init__()
+        self._fieldsX = fieldsX
+        self._fieldsY = fieldsY
+        self._fieldSize = self._patchSize  # Size of single field (nm)
+        self._writerClass = writerClass
+
+    ## Open new job.
+    #
+    # @param fileName Base filename of field jobs, table and log file
+    # @param stageCenter Stage position (mm) of center of the whole layout
+    # @param openArgs Passed to open() of each field writer (e.g. preview="off").
+    #                 Helper objects (estimator=..., checker=...) are copied
+    #                 for each field, so each field log reports its own job.
+    #                 preview must be a mode, cc6Sink is not possible (one
+    #                 file per field).
+    def open(self, fileName, stageCenter=(0.0, 0.0), **openArgs):
+        if not isinstance(openArgs.get("preview", "sync"), str):
+            raise ValueError("StitchWriter needs a preview mode, not a preview object")
+        if openArgs.get("cc6Sink") is not None:
+            raise ValueError("StitchWriter writes one CC6 file per field, cc6Sink is not possible")
+        self._fileName = fileName
+        self._stageCenter = stageCenter
+        self._openArgs = openArgs
+        self._shapes = []  # (kind, N x 5 array) in drawing order
+        self._logFile = open(fileName + "_log.txt", "w")
+
+    ## Split shapes into fields and write all files.
+    def close(self):
+        kind, shapes = self._collect()
+        F = self._fieldSize
+        x1, y1, x2, y2 = shapes[:, :4].T
+        width, height = self._drawingArea()
+        left = np.minimum(x1, x2)
+        bottom = np.minimum(y1, y2)
+        fx0 = np.floor(left / F).astype(int)
+        fy0 = np.floor(bottom / F).astype(int)
+        # Shapes on the right or top edge of the layout belong to the last
+        # field (as x == patchSize in CC6Writer)
+        fx0[left == width] = self._fieldsX - 1
+        fy0[bottom == height] = self._fieldsY - 1
+        # A shape ending on a field border still belongs to the lower field
+        fx1 = np.maximum(fx0, np.ceil(np.maximum(x1, x2) / F).astype(int) - 1)
+        fy1 = np.maximum(fy0, np.ceil(np.maximum(y1, y2) / F).astype(int) - 1)
+        outside = (fx0 < 0) | (fy0 < 0) | (fx1 >= self._fieldsX) | (fy1 >= self._fieldsY)
+        self._errorCount += int(np.count_nonzero(outside))
+
+        # Shapes in one field
+        single = ~outside & (fx0 == fx1) & (fy0 == fy1)
+        field = [(fy0 * self._fieldsX + fx0)[single]]
+        order = [np.flatnonzero(single)]
+        kinds = [kind[single]]
+        local = [shapes[single] - np.column_stack((fx0 * F, fy0 * F, fx0 * F, fy0 * F, 0 * fx0))[single]]
+
+        # Shapes crossing field borders are cut into pieces
+        pieces = []
+        for i in np.flatnonzero(~outside & ~single).tolist():
+            sX, sY, eX, eY, dose = shapes[i].tolist()
+            for fy in range(fy0[i], fy1[i] + 1):
+                for fx in range(fx0[i], fx1[i] + 1):
+                    left, bottom = fx * F, fy * F
+                    if kind[i] == _LINE:
+                        part = _clipLine(sX, sY, eX, eY, left, bottom, left + F, bottom + F)
+                    else:
+                        part = (
+                            max(min(sX, eX), left),
+                            max(min(sY, eY), bottom),
+                            min(max(sX, eX), left + F),
+                            min(max(sY, eY), bottom + F),
+                        )
+                        if part[0] >= part[2] or part[1] >= part[3]:
+                            part = None
+                    if part is not None:
+                        pieces.append(
+                            (fy * self._fieldsX + fx, i, kind[i])
+                            + (part[0] - left, part[1] - bottom, part[2] - left, part[3] - bottom, dose)
+                        )
+        if pieces:
+            pieces = np.array(pieces)
+            field.append(pieces[:, 0].astype(int))
+            order.append(pieces[:, 1].astype(int))
+            kinds.append(pieces[:, 2].astype(int))
+            local.append(pieces[:, 3:])
+
+        field = np.concatenate(field)
+        order = np.concatenate(order)
+        kinds = np.concatenate(kinds)
+        local = np.concatenate(local)
+        # Keep drawing order in each field
+        sort = np.lexsort((order, field))
+        field, kinds, local = field[sort], kinds[sort], local[sort]
+        self._writeFields(field, kinds, local)
+
+    ## Write CC6 job for each field and stage position table
+    def _writeFields(self, field, kinds, local):
+        F = self._fieldSize
+        width, height = self._drawingArea()
+        table = open(self._fileName + "_fields.txt", "w")
+        table.write("# file\tfield_x\tfield_y\tstage_x(mm)\tstage_y(mm)\tobjects\r\n")
+        fields, starts = np.unique(field, return_index=True)
+        ends = np.append(starts[1:], len(field))
+        for f, start, end in zip(fields.tolist(), starts.tolist(), ends.tolist()):
+            fy, fx = divmod(f, self._fieldsX)
+            name = "%s_x%d_y%d" % (self._fileName, fx, fy)
+            writer = self._writerClass()
+            writer.open(name, **copy.deepcopy(self._openArgs))
+            # Draw each run of same kind with one batch call
+            runKinds = kinds[start:end]
+            runStarts = start + np.concatenate(([0], np.flatnonzero(np.diff(runKinds)) + 1))
+            runEnds = np.append(runStarts[1:], end)
+            for a, b in zip(runStarts.tolist(), runEnds.tolist()):
+                if kinds[a] == _LINE:
+                    writer.drawLines(local[a:b])
+                elif kinds[a] == _SQUARE:
+                    writer.drawSquares(local[a:b])
+                else:
+                    writer.drawSpots(local[a:b][:, [0, 1, 4]])
+            writer.close()
+            self._commandCount += writer._commandCount
+            self._errorCount += writer._errorCount
+
+            # Stage position of field center
+            stageX = self._stageCenter[0] + ((fx + 0.5) * F - width / 2.0) * 1e-6
+            stageY = self._stageCenter[1] + ((fy + 0.5) * F - height / 2.0) * 1e-6
+            table.write(
+                "%s\t%d\t%d\t%.5f\t%.5f\t%d\r\n"
+                % (name, fx, fy, stageX, stageY, writer._commandCount)
+            )
+            self._log("%s: stage (%.5f, %.5f)" % (name, stageX, stageY))
+        table.close()
+
+        self._log("Fields:  %10d" % len(fields))
+        self._log("Objects: %10d" % self._commandCount)
+        self._log("Errors:  %10d" % self._errorCount)
+        self._logFile.close()
+
+    ## All shapes as kinds and N x 5 array [x1, y1, x2, y2, doseTime]
+    def _collect(self):
+        kind = [np.full(len(shapes), k) for k, shapes in self._shapes]
+        shapes = [shapes for _, shapes in self._shapes]
+        if not shapes:
+            return np.zeros(0, int), np.zeros((0, 5))
+        return np.concatenate(kind), np.concatenate(shapes)
+
+    def _drawingArea(self):
+        return self._fieldsX * self._fieldSize, self._fieldsY * self._fieldSize
+
+    # Workers of createPatterns collect shapes instead of commands
+    def _blockState(self):
+        state = super()._blockState()
+        state["_shapes"] = []
+        return state
+
+    def _takeBlock(self):
+        block = (self._shapes, self._errorCount)
+        self._shapes = []
+        self._errorCount = 0
+        return block
+
+    def _mergeBlock(self, block):
+        shapes, errorCount = block
+        self._shapes.extend(shapes)
+        self._errorCount += errorCount
+
+    ## Keep shapes, rounded to EB drawing cells
+    def _add(self, kind, shapes, nCoord, doseTime):
+        pos, dose = self._batch(shapes, nCoord, doseTime)
+        if kind == _SPOT:
+            pos = np.column_stack((pos, pos))
+        self._shapes.append((kind, np.column_stack((pos, dose))))
+
+    def drawLine(self, startX, startY, endX, endY, doseTime):
+        self.drawLines([[startX, startY, endX, endY, doseTime]])
+
+    def drawlineSquare(self, startX, startY, endX, endY, doseTime):
+        self.drawlineSquares([[startX, startY, endX, endY, doseTime]])
+
+    def drawlineSquares(self, squares, doseTime=None):
+        pos, dose = self._batch(squares, 4, doseTime)
+        left = np.minimum(pos[:, 0], pos[:, 2])
+        right = np.maximum(pos[:, 0], pos[:, 2])
+        bottom = np.minimum(pos[:, 1], pos[:, 3])
+        top = np.maximum(pos[:, 1], pos[:, 3])
+        # Top, bottom, left and right line of each rectangle
+        lines = np.stack(
+            (
+                (left, top, right, top, dose),
+                (left, bottom, right, bottom, dose),
+                (left, top, left, bottom, dose),
+                (right, top, right, bottom, dose),
+            ),
+            axis=1,
+        )
+        self._shapes.append((_LINE, lines.transpose(2, 1, 0).reshape(-1, 5)))
+
+    def drawSquare(self, startX, startY, endX, endY, doseTime):
+        self.drawSquares([[startX, startY, endX, endY, doseTime]])
+
+    def drawSpot(self, pX, pY, doseTime):
+        self.drawSpots([[pX, pY, doseTime]])
+
+    def drawLines(self, lines, doseTime=None):
+        self._add(_LINE, lines, 4, doseTime)
+
+    def drawSquares(self, squares, doseTime=None):
+        self._add(_SQUARE, squares, 4, doseTime)
+
+    def drawSpots(self, spots, doseTime=None):
+        self._add(_SPOT, spots, 2, doseTime)
+
+    ## Draw chip marker in every field
+    #
+    # @param width Marker width (nm)
+    # @param doseTime Dose time (μsec.)
+    def drawChipMarker(self, width=3000, doseTime=4.0):
+        F = self._fieldSize
+        marker = np.array(
+            [
+                [0, width, width, F - width],  # Left
+                [F - width, width, F, F - width],  # Right
+                [width, F - width, F - width, F],  # Top
+                [width, 0, F - width, width],  # Bottom
+            ],
+            dtype=float,
+        )
+        for fy in range(self._fieldsY):
+            for fx in range(self._fieldsX):
+                self.drawSquares(marker + (fx * F, fy * F, fx * F, fy * F), doseTime)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# GDSII stream output of CC6 commands (cells, references and arrays)
+#このファイルの単位はnm
+
+import struct
+import time
+
+import numpy as np
+
+from eb_cc6 import DWLL, DWSPS
+
+# Record types (record type << 8 | data type)
+_HEADER = 0x0002
+_BGNLIB = 0x0102
+_LIBNAME = 0x0206
+_UNITS = 0x0305
+_ENDLIB = 0x0400
+_BGNSTR = 0x0502
+_STRNAME = 0x0606
+_ENDSTR = 0x0700
+_BOUNDARY = 0x0800
+_PATH = 0x0900
+_SREF = 0x0A00
+_AREF = 0x0B00
+_LAYER = 0x0D02
+_DATATYPE = 0x0E02
+_WIDTH = 0x0F03
+_ENDEL = 0x1100
+_SNAME = 0x1206
+_COLROW = 0x1302
+_XY = 0x1003
+_PATHTYPE = 0x2102
+
+## Element records of all commands with same opcode, as one NumPy record
+#
+#  BOUNDARY (rectangles, spots) and PATH (lines) with fixed length, so all
+#  elements of a run are filled column-wise and written with tobytes().
+_BOUNDARY_DTYPE = np.dtype(
+    [
+        ("head", ">u2", 2),  # BOUNDARY
+        ("layer", ">u2", 3),  # LAYER
+        ("datatype", ">u2", 3),  # DATATYPE
+        ("xyHead", ">u2", 2),  # XY
+        ("xy", ">i4", 10),
+        ("end", ">u2", 2),  # ENDEL
+    ]
+)
+_PATH_DTYPE = np.dtype(
+    [
+        ("head", ">u2", 2),  # PATH
+        ("layer", ">u2", 3),  # LAYER
+        ("datatype", ">u2", 3),  # DATATYPE
+        ("pathtype", ">u2", 3),  # PATHTYPE
+        ("widthHead", ">u2", 2),  # WIDTH
+        ("width", ">i4"),
+        ("xyHead", ">u2", 2),  # XY
+        ("xy", ">i4", 4),
+        ("end", ">u2", 2),  # ENDEL
+    ]
+)
+
+
+## GDSII 8 byte real (excess 64, base 16 exponent)
+def _real8(value):
+    if value == 0:
+        return b"\0" * 8
+    sign = 0x80 if value < 0 else 0
+    value = abs(value)
+    exponent = 64
+    while value >= 1:
+        value /= 16.0
+        exponent += 1
+    while value < 1 / 16.0:
+        value *= 16.0
+        exponent -= 1
+    mantissa = int(round(value * 2**56))
+    if mantissa >= 2**56:
+        mantissa //= 16
+        exponent += 1
+    return struct.pack(">BB", sign | exponent, mantissa >> 48) + struct.pack(
+        ">HI", (mantissa >> 32) & 0xFFFF, mantissa & 0xFFFFFFFF
+    )
+
+
+## GDSII stream writer
+#
+#  Database unit is 1 nm, user unit is 1 μm. Lines are paths one cell
+#  (unit) wide with extended ends, rectangles and spots (one cell square)
+#  are boundaries, all on one layer. Dose is not kept (as in the dxf).
+#  HOWTO:
+#  1. gds = GDSStream(open("hoge.gds", "wb")); gds.begin("HOGE")
+#  2. gds.beginCell("CELL_0"); gds.writeShapes(...); gds.endCell()
+#  3. gds.beginCell("TOP"); gds.writeReference("CELL_0", ...); gds.endCell()
+#  4. gds.end()
+class GDSStream:
+    ## @param sink File opened in binary mode, or any object with write()
+    # @param unit Unit length per EB drawing cell (nm), width of lines
+    # @param layer GDSII layer of all elements
+    # @param datatype GDSII datatype of all elements
+    def __init__(self, sink, unit=5.0, layer=0, datatype=0):
+        self._sink = sink
+        self._unit = unit
+        self._layer = layer
+        self._datatype = datatype
+        self._date = time.localtime()[:6]
+        self.byteCount = 0  # Number of bytes written to sink
+
+    def _write(self, data):
+        self._sink.write(data)
+        self.byteCount += len(data)
+
+    ## Write one record
+    #
+    # @param data bytes, str (ASCII, padded to even length) or None
+    def _record(self, recordType, data=b""):
+        if isinstance(data, str):
+            data = data.encode("ascii")
+            if len(data) % 2:
+                data += b"\0"
+        self._write(struct.pack(">HH", len(data) + 4, recordType) + data)
+
+    def _dates(self):
+        return struct.pack(">12h", *(self._date * 2))
+
+    ## Write library header
+    def begin(self, libName="LIB"):
+        self._record(_HEADER, struct.pack(">h", 600))
+        self._record(_BGNLIB, self._dates())
+        self._record(_LIBNAME, libName)
+        # 1 nm database unit: 1e-3 user unit (μm), 1e-9 m
+        self._record(_UNITS, _real8(1e-3) + _real8(1e-9))
+
+    ## Write end of library
+    def end(self):
+        self._record(_ENDLIB)
+
+    def beginCell(self, name):
+        self._record(_BGNSTR, self._dates())
+        self._record(_STRNAME, name)
+
+    def endCell(self):
+        self._record(_ENDSTR)
+
+    ## Write elements of commands at positions (nm, y upwards)
+    #
+    # @param op Opcodes (DWLL, DWSL or DWSPS)
+    # @param x1, y1, x2, y2 Positions as from commandPositions
+    def writeShapes(self, op, x1, y1, x2, y2):
+        x1, y1, x2, y2 = [np.rint(v).astype(np.int64) for v in (x1, y1, x2, y2)]
+        line = op == DWLL
+        if line.any():
+            paths = np.zeros(np.count_nonzero(line), _PATH_DTYPE)
+            paths["head"] = (4, _PATH)
+            paths["layer"] = (6, _LAYER, self._layer)
+            paths["datatype"] = (6, _DATATYPE, self._datatype)
+            paths["pathtype"] = (6, _PATHTYPE, 2)
+            paths["widthHead"] = (8, _WIDTH)
+            paths["width"] = int(round(self._unit))
+            paths["xyHead"] = (20, _XY)
+            paths["xy"] = np.stack((x1[line], y1[line], x2[line], y2[line]), axis=1)
+            paths["end"] = (4, _ENDEL)
+            self._write(paths.tobytes())
+        box = ~line
+        if box.any():
+            half = int(round(self._unit)) // 2
+            spot = op[box] == DWSPS
+            lo = np.stack((np.minimum(x1[box], x2[box]), np.minimum(y1[box], y2[box])))
+            hi = np.stack((np.maximum(x1[box], x2[box]), np.maximum(y1[box], y2[box])))
+            lo[:, spot] -= half
+            hi[:, spot] += half
+            boundaries = np.zeros(np.count_nonzero(box), _BOUNDARY_DTYPE)
+            boundaries["head"] = (4, _BOUNDARY)
+            boundaries["layer"] = (6, _LAYER, self._layer)
+            boundaries["datatype"] = (6, _DATATYPE, self._datatype)
+            boundaries["xyHead"] = (44, _XY)
+            boundaries["xy"] = np.stack(
+                (lo[0], lo[1], hi[0], lo[1], hi[0], hi[1], lo[0], hi[1], lo[0], lo[1]),
+                axis=1,
+            )
+            boundaries["end"] = (4, _ENDEL)
+            self._write(boundaries.tobytes())
+
+    ## Write reference to cell (SREF, or AREF for columns x rows)
+    #
+    # @param x, y Position of cell origin (nm)
+    # @param spacing (column, row) spacing of array (nm)
+    def writeReference(self, name, x, y, columns=1, rows=1, spacing=(0, 0)):
+        x, y = int(round(x)), int(round(y))
+        if columns == 1 and rows == 1:
+            self._record(_SREF)
+            self._record(_SNAME, name)
+            self._record(_XY, struct.pack(">2i", x, y))
+        else:
+            dx, dy = int(round(spacing[0])), int(round(spacing[1]))
+            self._record(_AREF)
+            self._record(_SNAME, name)
+            self._record(_COLROW, struct.pack(">2h", columns, rows))
+            self._record(
+                _XY, struct.pack(">6i", x, y, x + columns * dx, y, x, y + rows * dy)
+            )
+        self._record(_ENDEL)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Hierarchical dxf and GDSII output: repeated level 1 patterns as cells
+#
+# Usage: python eb_hier.py d251031hs.CC6 --layout 10,10,5,5,5000,5000,1400
+#        Writes d251031hs_hier.dxf and d251031hs.gds
+
+import argparse
+
+import numpy as np
+
+from eb_cc6 import CC6Reader, commandPositions
+from eb_dot import PatternLayout
+from eb_dxf import DXFStream
+from eb_gds import GDSStream
+
+
+## Repeated cells of a job
+#
+#  Commands are put in the level 1 pattern (PatternLayout.locate) of their
+#  first point, everything outside the level 1 grids (10 bit markers, chip
+#  marker, ...) stays flat. Patterns with exactly the same geometry relative
+#  to their center are one cell, written once (dxf BLOCK, GDSII structure)
+#  and placed by reference. Equally spaced references in a row, and equal
+#  rows above each other, become one array (dxf INSERT with columns/rows,
+#  GDSII AREF). So the file size depends on the number of distinct cells.
+#  Geometry is the same as in the flat dxf; dose is not kept (myShape
+#  patterns which only differ in dose are one cell).
+#  HOWTO:
+#  1. hoge.open(your_filename_here, hierarchy=CellHierarchy())
+#  2. hoge.createPatterns(...) and other drawing functions, hoge.close()
+#  3. your_filename_here_hier.dxf and your_filename_here.gds are written
+class CellHierarchy:
+    ## @param dxf Write hierarchical dxf (fileName_hier.dxf)
+    # @param gds Write GDSII (fileName.gds)
+    # @param unit Unit length per EB drawing cell (nm)
+    # @param patchSize Size of single patch (nm)
+    def __init__(self, dxf=True, gds=True, unit=5.0, patchSize=300000):
+        self.dxf = dxf
+        self.gds = gds
+        self._unit = unit
+        self._patchSize = patchSize
+        self.cells = []  # (op, x1, y1, x2, y2) relative to cell origin (nm)
+        self.references = []  # (cell, x, y, columns, rows, dx, dy) (nm)
+        self.flat = None  # (op, x1, y1, x2, y2) of commands outside cells
+        self.instances = 0  # Number of placed patterns
+        self.commands = 0  # Number of all commands
+
+    ## Find cells in commands (COMMAND_DTYPE)
+    #
+    # @param layout PatternLayout of createPatterns, None: all flat
+    def build(self, rows, layout):
+        op = rows["op"]
+        x1, y1, x2, y2 = commandPositions(rows, self._unit, self._patchSize)
+        self.commands = len(rows)
+        self.cells = []
+        self.references = []
+        if layout is None:
+            self.flat = (op, x1, y1, x2, y2)
+            self.instances = 0
+            return self
+        lv1x, lv1y, lv2x, lv2y = layout.locate(x1, y1)
+        inside = lv1x >= 0
+        self.flat = tuple(v[~inside] for v in (op, x1, y1, x2, y2))
+
+        # Commands of each pattern (in drawn order)
+        pattern = ((lv2y * layout.lv2xnum + lv2x) * layout.lv1ynum + lv1y) * layout.lv1xnum + lv1x
+        index = np.flatnonzero(inside)
+        index = index[np.argsort(pattern[index], kind="stable")]
+        keys, starts = np.unique(pattern[index], return_index=True)
+        ends = np.append(starts[1:], len(index))
+        self.instances = len(keys)
+
+        cellIndex = {}  # Geometry bytes to cell number
+        placed = []  # (cell, x, y)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            commands = index[start:end]
+            i = commands[0]
+            ox, oy = layout.center(lv1x[i], lv1y[i], lv2x[i], lv2y[i])
+            ox, oy = float(np.rint(ox)), float(np.rint(oy))
+            shapes = (
+                op[commands],
+                x1[commands] - ox,
+                y1[commands] - oy,
+                x2[commands] - ox,
+                y2[commands] - oy,
+            )
+            key = shapes[0].tobytes() + np.rint(np.stack(shapes[1:])).astype(np.int64).tobytes()
+            if key not in cellIndex:
+                cellIndex[key] = len(self.cells)
+                self.cells.append(shapes)
+            placed.append((cellIndex[key], ox, oy))
+        self.references = self._arrays(placed)
+        return self
+
+    ## Join equally spaced references into arrays
+    #
+    # @param placed [(cell, x, y)]
+    # @return [(cell, x, y, columns, rows, dx, dy)]
+    def _arrays(self, placed):
+        # Rows: equally spaced in x with same cell and y
+        rows = []
+        for (cell, y), xs in self._runs([((cell, y), x) for cell, x, y in placed]):
+            dx = xs[1] - xs[0] if len(xs) > 1 else 0.0
+            rows.append(((cell, xs[0], len(xs), dx), y))
+        # Equal rows equally spaced in y
+        arrays = []
+        for (cell, x, columns, dx), ys in self._runs(rows):
+            dy = ys[1] - ys[0] if len(ys) > 1 else 0.0
+            arrays.append((cell, x, ys[0], columns, len(ys), dx, dy))
+        return arrays
+
+    ## Runs of equally spaced positions with same key
+    #
+    # @param items [(key, position)]
+    # @return [(key, [positions])]
+    @staticmethod
+    def _runs(items):
+        groups = {}
+        for key, position in items:
+            groups.setdefault(key, []).append(position)
+        runs = []
+        for key, positions in groups.items():
+            positions.sort()
+            run = [positions[0]]
+            for position in positions[1:]:
+                if len(run) == 1 or position - run[-1] == run[1] - run[0]:
+                    run.append(position)
+                else:
+                    runs.append((key, run))
+                    run = [position]
+            runs.append((key, run))
+        return runs
+
+    ## Write files of last build
+    #
+    # @param fileName File name without extension
+    def save(self, fileName):
+        if self.dxf:
+            self.writeDXF(fileName + "_hier.dxf")
+        if self.gds:
+            self.writeGDS(fileName + ".gds")
+
+    def writeDXF(self, fileName):
+        with open(fileName, "w", encoding="cp1252", errors="replace") as f:
+            stream = DXFStream(f, self._unit, self._patchSize)
+            stream.begin(blocks=True)
+            for i, shapes in enumerate(self.cells):
+                stream.beginBlock("CELL_%d" % i)
+                stream.writeShapes(*shapes)
+                stream.endBlock()
+            stream.endBlocks()
+            for cell, x, y, columns, rows, dx, dy in self.references:
+                stream.writeInsert("CELL_%d" % cell, x, y, columns, rows, (dx, dy))
+            stream.writeShapes(*self.flat)
+            stream.end()
+
+    ## Write GDSII file (top structure "TOP" with flat shapes and references)
+    def writeGDS(self, fileName, libName="EBLITHO"):
+        with open(fileName, "wb") as f:
+            stream = GDSStream(f, self._unit)
+            stream.begin(libName)
+            for i, shapes in enumerate(self.cells):
+                stream.beginCell("CELL_%d" % i)
+                stream.writeShapes(*shapes)
+                stream.endCell()
+            stream.beginCell("TOP")
+            for cell, x, y, columns, rows, dx, dy in self.references:
+                stream.writeReference("CELL_%d" % cell, x, y, columns, rows, (dx, dy))
+            stream.writeShapes(*self.flat)
+            stream.endCell()
+            stream.end()
+
+    ## Report as text lines
+    def report(self):
+        inCells = sum(len(shapes[0]) for shapes in self.cells)
+        return [
+            "Cells:      %10d (%d commands)" % (len(self.cells), inCells),
+            "Patterns:   %10d in %d references" % (self.instances, len(self.references)),
+            "Flat:       %10d of %d commands" % (len(self.flat[0]), self.commands),
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write CC6 file as hierarchical dxf and GDSII")
+    parser.add_argument("fileName")
+    parser.add_argument(
+        "--layout",
+        help="createPatterns arguments lv1xnum,lv1ynum,lv2xnum,lv2ynum,"
+        "lv1width,lv1height[,size10BitMarker] to find cells (default: all flat)",
+    )
+    parser.add_argument("--no-dxf", dest="dxf", action="store_false")
+    parser.add_argument("--no-gds", dest="gds", action="store_false")
+    args = parser.parse_args()
+
+    layout = None
+    if args.layout:
+        values = [float(v) for v in args.layout.split(",")]
+        layout = PatternLayout(*[int(v) for v in values[:4]], *values[4:])
+
+    hierarchy = CellHierarchy(args.dxf, args.gds)
+    hierarchy.build(CC6Reader(args.fileName).read(), layout)
+    hierarchy.save(args.fileName.rsplit(".", 1)[0])
+    for line in hierarchy.report():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
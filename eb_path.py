@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Reorders CC6 commands to shorten beam jumps between commands
+#
+# Usage: python eb_path.py d251031hs.CC6 d251031hs_path.CC6 --method hilbert
+
+import argparse
+
+import numpy as np
+
+from eb_cc6 import CC6Reader, CC6Stream, CommandTable, commandPositions
+
+
+## Index of points on Hilbert curve (x, y: integer arrays below 2 ** bits)
+def _hilbertKey(x, y, bits=17):
+    x = x.astype(np.int64)
+    y = y.astype(np.int64)
+    n = 1 << bits
+    key = np.zeros(len(x), np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        key += s * s * ((3 * rx) ^ ry)
+        # Rotate quadrant
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return key
+
+
+## Beam path ordering of commands
+#
+#  Commands drawn one after another within linkDistance are kept together
+#  as a chain (e.g. lines of one dot), so only the long jumps between
+#  chains are optimized. Chains are sorted along a space filling curve
+#  (method "hilbert", or "serpentine" rows of bandWidth), then each run of
+#  window chains on the curve is reordered by nearest neighbor (all runs at
+#  once with NumPy). If the result is not shorter, drawn order is kept.
+#  Commands are kept as they are, only their order changes.
+#  Constraints (see CC6Writer.fixedOrder / orderBarrier):
+#  - fixed (start, end) ranges are moved as one item in drawn order
+#  - commands are never moved across a barrier index
+#  Give to CC6Writer.open(pathOrder=...) to reorder before writing CC6.
+class PathOrder:
+    ## @param method "hilbert" or "serpentine"
+    # @param window Number of commands in nearest neighbor refinement (1: off)
+    # @param bandWidth Row height of "serpentine" (nm)
+    # @param linkDistance Longest jump (nm) inside chain of commands
+    # @param unit Unit length per EB drawing cell (nm)
+    # @param patchSize Size of single patch (nm)
+    def __init__(
+        self,
+        method="hilbert",
+        window=16,
+        bandWidth=5000,
+        linkDistance=1000,
+        unit=5.0,
+        patchSize=300000,
+    ):
+        if method not in ("hilbert", "serpentine"):
+            raise ValueError("Unknown path order method: %s" % method)
+        self.method = method
+        self.window = window
+        self.bandWidth = bandWidth
+        self.linkDistance = linkDistance
+        self._unit = unit
+        self._patchSize = patchSize
+        self.travelBefore = 0.0  # Total beam jump (nm) in drawn order
+        self.travelAfter = 0.0  # Total beam jump (nm) in new order
+
+    ## New order of commands
+    #
+    # @param rows Commands (COMMAND_DTYPE) in drawn order
+    # @param fixed List of (start, end) command index ranges kept together
+    # @param barriers Command indices which no command is moved across
+    # @return Index array, rows[index] is the new order
+    def order(self, rows, fixed=(), barriers=()):
+        n = len(rows)
+        if n == 0:
+            return np.zeros(0, int)
+        x1, y1, x2, y2 = commandPositions(rows, self._unit, self._patchSize)
+
+        # Items: chains of near commands and fixed ranges
+        head = np.ones(n, bool)
+        head[1:] = np.hypot(x1[1:] - x2[:-1], y1[1:] - y2[:-1]) > self.linkDistance
+        barriers = np.sort(np.asarray(barriers, int))
+        head[barriers[barriers < n]] = True
+        for start, end in fixed:
+            head[start + 1 : end] = False
+        first = np.flatnonzero(head)
+        last = np.append(first[1:], n) - 1
+        entry = np.stack((x1[first], y1[first]), axis=1)
+        leave = np.stack((x2[last], y2[last]), axis=1)
+        segment = np.searchsorted(barriers, first, side="right")
+
+        items = np.lexsort((self._curveKey(entry), segment))
+        if self.window > 1:
+            items = self._refine(items, entry, leave, segment)
+
+        before = self._travel(np.arange(len(first)), entry, leave)
+        after = self._travel(items, entry, leave)
+        if after >= before:
+            items = np.arange(len(first))
+            after = before
+        self.travelBefore += before
+        self.travelAfter += after
+
+        # Expand items to command indices
+        lengths = (last - first + 1)[items]
+        offsets = np.cumsum(lengths) - lengths
+        return np.repeat(first[items] - offsets, lengths) + np.arange(n)
+
+    ## Report as text lines
+    def report(self):
+        saved = 0.0
+        if self.travelBefore > 0:
+            saved = 100.0 * (1.0 - self.travelAfter / self.travelBefore)
+        return [
+            "Beam path (%s):" % self.method,
+            "  Jumps before:  %12.3f mm" % (self.travelBefore * 1e-6),
+            "  Jumps after:   %12.3f mm" % (self.travelAfter * 1e-6),
+            "  Saved:         %12.1f %%" % saved,
+        ]
+
+    ## Sort key of points (nm) along the curve
+    def _curveKey(self, points):
+        cells = np.rint(points / self._unit).astype(np.int64)
+        cells -= cells.min(axis=0)
+        if self.method == "hilbert":
+            bits = max(1, int(cells.max()).bit_length())
+            return _hilbertKey(cells[:, 0], cells[:, 1], bits)
+        # Serpentine: rows from bottom, x direction flips on every row
+        band = points[:, 1] // self.bandWidth
+        x = np.where(band % 2 == 0, cells[:, 0], cells[:, 0].max() - cells[:, 0])
+        return band.astype(np.int64) * (int(cells[:, 0].max()) + 1) + x
+
+    ## Nearest neighbor order inside runs of window items of same segment
+    def _refine(self, items, entry, leave, segment):
+        w = self.window
+        seg = segment[items]
+        # Position of each item in its run
+        segStart = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        rank = np.arange(len(items)) - np.repeat(segStart, np.diff(np.r_[segStart, len(items)]))
+        runHead = (rank % w) == 0
+        run = np.cumsum(runHead) - 1
+        column = np.arange(len(items)) - np.flatnonzero(runHead)[run]
+
+        table = np.full((run[-1] + 1, w), -1, np.int64)
+        table[run, column] = items
+        valid = table >= 0
+        result = np.empty_like(table)
+        rowIndex = np.arange(len(table))
+        # First item of each run stays first
+        current = table[:, 0]
+        result[:, 0] = current
+        valid[:, 0] = False
+        entryX = np.where(valid, entry[table, 0], 0.0)
+        entryY = np.where(valid, entry[table, 1], 0.0)
+        for step in range(1, w):
+            distance = np.hypot(entryX - leave[current, 0][:, None], entryY - leave[current, 1][:, None])
+            distance[~valid] = np.inf
+            pick = np.argmin(distance, axis=1)
+            picked = valid[rowIndex, pick]
+            current = np.where(picked, table[rowIndex, pick], current)
+            result[:, step] = np.where(picked, current, -1)
+            valid[rowIndex, pick] = False
+        # Keep curve order in runs where nearest neighbor is not shorter
+        # (including jump to first item of next run)
+        nextHead = np.append(table[1:, 0], -1)
+        worse = self._runTravel(result, nextHead, entry, leave) >= self._runTravel(
+            table, nextHead, entry, leave
+        )
+        result[worse] = table[worse]
+        result = result.ravel()
+        return result[result >= 0]
+
+    ## Travel (nm) of each run (table rows, -1 at end) and jump to nextHead
+    @staticmethod
+    def _runTravel(table, nextHead, entry, leave):
+        count = (table >= 0).sum(axis=1)
+        sequence = np.column_stack((table, np.full(len(table), -1)))
+        sequence[np.arange(len(table)), count] = nextHead
+        valid = (sequence[:, 1:] >= 0) & (sequence[:, :-1] >= 0)
+        jump = entry[sequence[:, 1:]] - leave[sequence[:, :-1]]
+        return np.where(valid, np.hypot(jump[..., 0], jump[..., 1]), 0.0).sum(axis=1)
+
+    ## Sum of jumps (nm) from end of each item to start of next item
+    @staticmethod
+    def _travel(items, entry, leave):
+        if len(items) < 2:
+            return 0.0
+        jump = entry[items[1:]] - leave[items[:-1]]
+        return float(np.hypot(jump[:, 0], jump[:, 1]).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reorder CC6 file for shorter beam path")
+    parser.add_argument("fileName")
+    parser.add_argument("outFileName")
+    parser.add_argument("--method", default="hilbert", choices=("hilbert", "serpentine"))
+    parser.add_argument("--window", type=int, default=16, help="nearest neighbor window")
+    args = parser.parse_args()
+
+    rows = CC6Reader(args.fileName).read()
+    pathOrder = PathOrder(args.method, args.window)
+    rows = rows[pathOrder.order(rows)]
+
+    with open(args.outFileName, "w", newline="") as f:
+        stream = CC6Stream(f)
+        stream.begin()
+        table = CommandTable()
+        table.subscribe(stream.writeCommands)
+        table.extend(rows)
+        stream.end()
+    for line in pathOrder.report():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
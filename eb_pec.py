@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Proximity effect correction of CC6 doses
+#
+# Usage: python eb_pec.py d251031hs.CC6 d251031hs_pec.CC6 --beta 10000 --eta 0.7
+
+import argparse
+
+import numpy as np
+
+from eb_cc6 import DWLL, DWSL, CC6Reader, CC6Stream, CommandTable, commandPositions
+
+
+## Smallest size >= n with only factors 2, 3, 5 (fast FFT)
+def _fftSize(n):
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+
+## Gaussian exp(-r^2 / sigma^2) on pixel offsets, sum is 1
+def _gaussian(dx, dy, sigma):
+    g = np.exp(-(dx**2 + dy**2) / float(sigma) ** 2)
+    return g / g.sum()
+
+
+## Proximity effect correction by dose modulation
+#
+#  Point spread function (r, sigma in nm):
+#    (exp(-r^2/alpha^2) / (pi alpha^2) + eta exp(-r^2/beta^2) / (pi beta^2)) / (1 + eta)
+#  Doses of all commands are put on a grid of pixel (dose per cell area),
+#  convolved with the function by FFT, and the exposure of each command is
+#  the average over its pixels. Forward scattering of a command itself is
+#  assumed to stay inside the command.
+#  Doses are rescaled until every command gets the exposure of a small
+#  isolated command with its original dose, so large or dense areas get
+#  less dose (iterations, within doseMin and doseMax).
+#  Memory and time are O(commands + grid), not O(commands^2).
+class ProximityCorrector:
+    ## @param alpha Forward scattering range (nm)
+    # @param beta Backscattering range (nm)
+    # @param eta Ratio of backscattered to forward energy
+    # @param pixel Grid pixel size (nm)
+    # @param iterations Maximum number of dose updates
+    # @param tolerance Stop when all exposures are within this ratio of target
+    # @param unit Unit length per EB drawing cell (nm)
+    # @param patchSize Size of single patch (nm)
+    def __init__(
+        self,
+        alpha=30.0,
+        beta=10000.0,
+        eta=0.7,
+        pixel=250.0,
+        iterations=10,
+        tolerance=1e-3,
+        unit=5.0,
+        patchSize=300000,
+    ):
+        self.alpha = alpha
+        self.beta = beta
+        self.eta = eta
+        self.pixel = pixel
+        self.iterations = iterations
+        self.tolerance = tolerance
+        self._unit = unit
+        self._patchSize = patchSize
+        self._kernel = None  # FFT of convolution kernel
+        self.iterationCount = 0
+        self.maxError = 0.0  # Largest |exposure / target - 1| after correction
+        self.doseRatio = (1.0, 1.0)  # Smallest and largest new / old dose
+
+    ## Corrected copy of commands
+    #
+    # @param rows Commands (COMMAND_DTYPE)
+    # @param doseMin, doseMax Limits of dose time (μsec.)
+    def correct(self, rows, doseMin=0.1, doseMax=3200):
+        rows = rows.copy()
+        if len(rows) == 0:
+            return rows
+        shape, pixel, weight = self._footprint(rows)
+        weightSum = np.bincount(shape, weights=weight, minlength=len(rows))
+        target = rows["dose"] / (1.0 + self.eta)
+        dose = rows["dose"].copy()
+        for self.iterationCount in range(1, self.iterations + 1):
+            ratio = self._exposure(dose, shape, pixel, weight, weightSum) / target
+            self.maxError = float(np.abs(ratio - 1.0).max())
+            if self.maxError < self.tolerance:
+                break
+            dose = np.clip(dose / ratio, doseMin, doseMax)
+        ratio = self._exposure(dose, shape, pixel, weight, weightSum) / target
+        self.maxError = float(np.abs(ratio - 1.0).max())
+        change = dose / rows["dose"]
+        self.doseRatio = (float(change.min()), float(change.max()))
+        rows["dose"] = dose
+        return rows
+
+    ## Report as text lines
+    def report(self):
+        return [
+            "Proximity correction (beta %g nm, eta %g):" % (self.beta, self.eta),
+            "  Iterations:    %12d" % self.iterationCount,
+            "  Dose ratio:    %12.3f - %.3f" % self.doseRatio,
+            "  Exposure error:%12.4f" % self.maxError,
+        ]
+
+    ## Exposure of each command with doses (same unit as dose)
+    def _exposure(self, dose, shape, pixel, weight, weightSum):
+        cellsPerPixel = (self.pixel / self._unit) ** 2
+        ny, nx = self._gridSize()
+        density = np.bincount(pixel, weights=weight * dose[shape], minlength=ny * nx)
+        density = density.reshape(ny, nx) / cellsPerPixel
+        kernel = self._kernelFFT()
+        near = np.fft.irfft2(np.fft.rfft2(density, self._fftShape) * kernel, self._fftShape)
+        near = near[:ny, :nx].ravel()
+        near = np.bincount(shape, weights=weight * near[pixel], minlength=len(dose))
+        return dose / (1.0 + self.eta) + near / weightSum
+
+    ## Number of pixels (y, x) of grid over the patch
+    def _gridSize(self):
+        n = int(np.ceil(self._patchSize / self.pixel))
+        return n, n
+
+    ## FFT of kernel (psf without forward scattering of command itself)
+    def _kernelFFT(self):
+        if self._kernel is None:
+            radius = int(np.ceil(3.0 * max(self.alpha, self.beta) / self.pixel))
+            ny, nx = self._gridSize()
+            self._fftShape = (_fftSize(ny + radius), _fftSize(nx + radius))
+            offset = np.arange(-radius, radius + 1)
+            dx, dy = np.meshgrid(offset * self.pixel, offset * self.pixel)
+            kernel = _gaussian(dx, dy, self.alpha) + self.eta * _gaussian(dx, dy, self.beta)
+            kernel[radius, radius] -= 1.0
+            kernel /= 1.0 + self.eta
+            grid = np.zeros(self._fftShape)
+            grid[np.ix_(offset % self._fftShape[0], offset % self._fftShape[1])] = kernel
+            self._kernel = np.fft.rfft2(grid)
+        return self._kernel
+
+    ## Sample points of commands on the grid
+    #
+    # @return (shape, pixel, weight): command index, flat pixel index and
+    #         exposed cells of each sample
+    def _footprint(self, rows):
+        x1, y1, x2, y2 = commandPositions(rows, self._unit, self._patchSize)
+        op = rows["op"]
+        dx = x2 - x1
+        dy = y2 - y1
+        line = op == DWLL
+        square = op == DWSL
+        # Samples per command: along lines, nx * ny for rectangles, 1 for spots
+        nx = np.where(square, np.maximum(1, np.ceil(np.abs(dx) / self.pixel)), 1).astype(int)
+        ny = np.where(square, np.maximum(1, np.ceil(np.abs(dy) / self.pixel)), 1).astype(int)
+        nx = np.where(line, np.ceil(np.hypot(dx, dy) / self.pixel).astype(int) + 1, nx)
+        cells = np.where(
+            line,
+            np.maximum(np.hypot(dx, dy) / self._unit, 1.0),
+            np.where(
+                square,
+                (np.abs(dx) / self._unit + 1) * (np.abs(dy) / self._unit + 1),
+                1.0,
+            ),
+        )
+        count = nx * ny
+        shape = np.repeat(np.arange(len(rows)), count)
+        local = np.arange(len(shape)) - np.repeat(np.cumsum(count) - count, count)
+        i = local % nx[shape]
+        j = local // nx[shape]
+        # Lines: points along line, rectangles: grid of points, spots: point
+        tx = (i + 0.5) / nx[shape]
+        ty = np.where(line[shape], tx, (j + 0.5) / ny[shape])
+        x = x1[shape] + tx * dx[shape]
+        y = y1[shape] + ty * dy[shape]
+        gy, gx = self._gridSize()
+        px = np.clip((x / self.pixel).astype(int), 0, gx - 1)
+        py = np.clip((y / self.pixel).astype(int), 0, gy - 1)
+        return shape, py * gx + px, (cells / count)[shape]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proximity effect correction of CC6 file")
+    parser.add_argument("fileName")
+    parser.add_argument("outFileName")
+    parser.add_argument("--alpha", type=float, default=30.0, help="nm")
+    parser.add_argument("--beta", type=float, default=10000.0, help="nm")
+    parser.add_argument("--eta", type=float, default=0.7)
+    parser.add_argument("--pixel", type=float, default=250.0, help="nm")
+    args = parser.parse_args()
+
+    corrector = ProximityCorrector(args.alpha, args.beta, args.eta, args.pixel)
+    rows = corrector.correct(CC6Reader(args.fileName).read())
+
+    with open(args.outFileName, "w", newline="") as f:
+        stream = CC6Stream(f)
+        stream.begin()
+        table = CommandTable()
+        table.subscribe(stream.writeCommands)
+        table.extend(rows)
+        stream.end()
+    for line in corrector.report():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Call counts and timings of CC6Writer (see CC6Writer.open(profile=...))
+
+import json
+import time
+
+
+## Instrumentation of CC6Writer
+#
+#  attach() replaces the methods of one writer instance by timed wrappers,
+#  so there is no cost when no Profiler is given.
+#  - calls: {name: [count, seconds]}, times include called functions
+#    (e.g. myShape includes setDot and drawDot)
+#  - phases: [(name, seconds)] of generate / CC6 flush / reports / DXF save
+#  - bytes: {output: size} of written files
+#  HOWTO:
+#  1. hoge.open(your_filename_here, profile=Profiler("profile.json"))
+#  2. Results are in the log (and in profile.json) after hoge.close()
+class Profiler:
+    # Methods of CC6Writer timed by attach()
+    methods = (
+        "createPatterns",
+        "myShape",
+        "shapeTemplate",
+        "setDot",
+        "drawDot",
+        "draw10BitMarker",
+        "draw10BitLineMarker",
+        "drawChipMarker",
+        "drawLine",
+        "drawlineSquare",
+        "drawSquare",
+        "drawSpot",
+        "drawLines",
+        "drawlineSquares",
+        "drawSquares",
+        "drawSpots",
+    )
+
+    ## @param jsonFile Also write results to this JSON file, or None
+    def __init__(self, jsonFile=None):
+        self.jsonFile = jsonFile
+        self.calls = {}
+        self.phases = []
+        self.bytes = {}
+        self._phase = None
+        self._phaseStart = 0.0
+
+    ## Function which calls function and adds its time to calls[name]
+    def timed(self, name, function):
+        calls = self.calls.setdefault(name, [0, 0.0])
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                calls[0] += 1
+                calls[1] += clock() - start
+
+        return wrapper
+
+    ## Time methods of writer instance
+    def attach(self, writer):
+        for name in self.methods:
+            if hasattr(writer, name):
+                setattr(writer, name, self.timed(name, getattr(writer, name)))
+
+    ## End current phase and start next one (None: end only)
+    def phase(self, name):
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases.append((self._phase, now - self._phaseStart))
+        self._phase = name
+        self._phaseStart = now
+
+    ## Report as text lines
+    def report(self):
+        lines = ["Profile:"]
+        for name, seconds in self.phases:
+            lines.append("  Phase %-16s %10.3f s" % (name, seconds))
+        for name, (count, seconds) in sorted(
+            self.calls.items(), key=lambda item: -item[1][1]
+        ):
+            if count:
+                lines.append(
+                    "  %-22s %10d calls %10.3f s %8.2f us/call"
+                    % (name, count, seconds, seconds / count * 1e6)
+                )
+        for name, size in self.bytes.items():
+            lines.append("  Bytes %-16s %10d" % (name, size))
+        return lines
+
+    ## Results as dict (same as JSON file)
+    def results(self):
+        return {
+            "phases": dict(self.phases),
+            "calls": dict(
+                (name, {"count": count, "seconds": seconds})
+                for name, (count, seconds) in self.calls.items()
+            ),
+            "bytes": self.bytes,
+        }
+
+    ## Write results to JSON file
+    def save(self, fileName=None):
+        with open(fileName or self.jsonFile, "w") as f:
+            json.dump(self.results(), f, indent=2)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Raster (PNG) preview of CC6 commands, much faster than dxf
+#
+# Usage: python eb_raster.py d251031hs.CC6 --pixel 50 --heat
+
+import argparse
+
+import numpy as np
+from matplotlib import image
+
+from eb_cc6 import DWLL, DWSL, CC6Reader, commandPositions
+
+
+## PNG preview of CommandTable rows
+#
+#  Same interface as DXFPreview (commands / save), so it can be given to
+#  CC6Writer.open(preview=RasterPreview(...)) or preview="png".
+#  Every pixel sums the doses of all commands crossing it, weighted by
+#  their length (lines) or area (rectangles) in pixels, at least one pixel:
+#  lines are sampled along their length, rectangles are filled (summed
+#  area table), spots are points. So lines thinner than a pixel are still
+#  visible. The image is scaled so that the brightest 0.5 % are saturated,
+#  in gray or as heat map.
+class RasterPreview:
+    ## @param fileName PNG file name
+    # @param unit Unit length per EB drawing cell (nm)
+    # @param patchSize Size of single patch (nm)
+    # @param pixel Pixel size (nm)
+    # @param heat Color by dose (heat map) instead of gray
+    def __init__(self, fileName, unit=5.0, patchSize=300000, pixel=100.0, heat=False):
+        self._fileName = fileName
+        self._unit = unit
+        self._patchSize = patchSize
+        self._pixel = pixel
+        self._heat = heat
+        self._size = int(np.ceil(patchSize / float(pixel)))
+        n = self._size
+        self._points = np.zeros(n * n)  # Lines and spots
+        self._areas = np.zeros((n + 1) * (n + 1))  # Corners of rectangles
+        # (pixel indices, weights) not yet added to _points / _areas
+        self._pending = {"points": [], "areas": []}
+        self._pendingCount = 0
+
+    ## Add CommandTable rows
+    def commands(self, rows):
+        x1, y1, x2, y2 = commandPositions(rows, self._unit, self._patchSize)
+        op = rows["op"]
+        dose = rows["dose"]
+        square = op == DWSL
+        points = ~square
+        if points.any():
+            self._addPoints(
+                x1[points], y1[points], x2[points], y2[points], dose[points], op[points] == DWLL
+            )
+        if square.any():
+            self._addAreas(x1[square], y1[square], x2[square], y2[square], dose[square])
+
+    ## Write out PNG file
+    def save(self):
+        self._flush()
+        n = self._size
+        areas = self._areas.reshape(n + 1, n + 1).cumsum(axis=0).cumsum(axis=1)[:n, :n]
+        dose = self._points.reshape(n, n) + areas
+        # Row 0 is the top of the patch (y upwards in nm)
+        dose = dose[::-1]
+        exposed = dose[dose > 0]
+        scale = np.percentile(exposed, 99.5) if len(exposed) else 1.0
+        image.imsave(
+            self._fileName,
+            np.clip(dose / scale, 0.0, 1.0),
+            cmap="inferno" if self._heat else "gray",
+            vmin=0.0,
+            vmax=1.0,
+        )
+
+    ## Lines (sampled at half pixel steps) and spots
+    def _addPoints(self, x1, y1, x2, y2, dose, line):
+        length = np.hypot(x2 - x1, y2 - y1)
+        count = np.ceil(2 * length / self._pixel).astype(int) + 1
+        # Pixels crossed by line, 1 for spots
+        pixels = np.where(line, np.maximum(length / self._pixel, 1.0), 1.0)
+        index = np.repeat(np.arange(len(x1)), count)
+        step = np.arange(len(index)) - np.repeat(np.cumsum(count) - count, count)
+        t = (step + 0.5) / count[index]
+        px = self._pixelIndex(x1[index] + t * (x2 - x1)[index])
+        py = self._pixelIndex(y1[index] + t * (y2 - y1)[index])
+        self._add("points", py * self._size + px, (dose * pixels / count)[index])
+
+    ## Filled rectangles: dose on all pixels they cover
+    def _addAreas(self, x1, y1, x2, y2, dose):
+        n = self._size + 1
+        px0 = self._pixelIndex(np.minimum(x1, x2))
+        px1 = self._pixelIndex(np.maximum(x1, x2)) + 1
+        py0 = self._pixelIndex(np.minimum(y1, y2))
+        py1 = self._pixelIndex(np.maximum(y1, y2)) + 1
+        # Spread area of rectangle (in pixels) evenly on its pixels
+        width = np.maximum(np.abs(x2 - x1) / self._pixel, 1.0)
+        height = np.maximum(np.abs(y2 - y1) / self._pixel, 1.0)
+        value = dose * width * height / ((px1 - px0) * (py1 - py0))
+        corners = ((py0, px0, 1), (py0, px1, -1), (py1, px0, -1), (py1, px1, 1))
+        self._add(
+            "areas",
+            np.concatenate([py * n + px for py, px, _ in corners]),
+            np.concatenate([sign * value for _, _, sign in corners]),
+        )
+
+    ## Keep pixel indices and weights of a chunk
+    #
+    # They are summed into the image (bincount over all pixels) only when
+    # more values than pixels are kept, so the cost per chunk depends on
+    # its commands and not on the image size.
+    def _add(self, target, index, weights):
+        self._pending[target].append((index, weights))
+        self._pendingCount += len(index)
+        if self._pendingCount > self._size * self._size:
+            self._flush()
+
+    def _flush(self):
+        for target, grid in (("points", self._points), ("areas", self._areas)):
+            pending = self._pending[target]
+            if pending:
+                grid += np.bincount(
+                    np.concatenate([index for index, _ in pending]),
+                    weights=np.concatenate([weights for _, weights in pending]),
+                    minlength=len(grid),
+                )
+            pending.clear()
+        self._pendingCount = 0
+
+    def _pixelIndex(self, position):
+        return np.clip((position / self._pixel).astype(int), 0, self._size - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw CC6 file as PNG")
+    parser.add_argument("fileName")
+    parser.add_argument("--out", help="PNG file (default: CC6 name with .png)")
+    parser.add_argument("--pixel", type=float, default=100.0, help="nm")
+    parser.add_argument("--heat", action="store_true", help="dose heat map")
+    args = parser.parse_args()
+
+    out = args.out or args.fileName.rsplit(".", 1)[0] + ".png"
+    preview = RasterPreview(out, pixel=args.pixel, heat=args.heat)
+    for rows in CC6Reader(args.fileName).chunks():
+        preview.commands(rows)
+    preview.save()
+
+
+if __name__ == "__main__":
+    main()
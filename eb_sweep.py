@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.eblitho
+#
+# Generates CC6 jobs for all combinations of myShape constants
+#
+# Usage: python eb_sweep.py d251101hs --param dose=40,50,60 --param dis=80,90
+#        Writes d251101hs_000.CC6/.dxf/_log.txt ... and d251101hs_manifest.txt
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+
+from eb_dot import CC6Writer
+from eb_estimate import ExposureEstimator
+
+_templates = {}  # Dots of myShape shared by all variants (see shapeTemplate)
+
+
+## Set up worker process with precomputed dots
+def _sweepInit(templates):
+    _templates.update(templates)
+
+
+## Write one variant
+#
+# @param job (fileName, params, patterns, preview)
+# @return Summary of variant for the manifest
+def _sweepWorker(job):
+    fileName, params, patterns, preview = job
+    writer = CC6Writer()
+    writer._templates = _templates
+    writer.setShapeBase(**params)
+    estimator = ExposureEstimator()
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.open(fileName, preview=preview, estimator=estimator)
+        writer.createPatterns(*patterns, useTemplate=True)
+        writer.drawChipMarker(doseTime=0.5)
+        writer.close()
+    return dict(
+        file=fileName,
+        params=params,
+        commands=writer._commandCount,
+        errors=writer._errorCount,
+        time=estimator.fieldTime(),
+    )
+
+
+## Runner of parameter sweeps
+#
+#  Every combination of the given values of myShape constants (see
+#  CC6Writer.setShapeBase) is written as fileName_000, fileName_001, ...
+#  with createPatterns(*patterns) and chip marker, in a process pool.
+#  Dots of each distinct shape are computed once before the pool starts and
+#  shared by all variants (only dose differs between many of them).
+#  The manifest (fileName_manifest.txt and .json) lists parameters,
+#  command counts and estimated write time of each variant.
+#  HOWTO:
+#  1. sweep = ParameterSweep("d251101hs", dict(dose=[40, 50], dis=[80, 90]))
+#  2. sweep.run(workers=4)
+class ParameterSweep:
+    ## @param fileName Base filename of variants and manifest
+    # @param grid {name: [values]} of myShape constants
+    # @param patterns createPatterns arguments (lv1xnum ... size10BitMarker)
+    # @param preview Preview mode of each variant (see CC6Writer.open)
+    def __init__(
+        self,
+        fileName,
+        grid,
+        patterns=(10, 10, 5, 5, 5000, 5000, 1.0, 1400),
+        preview="sync",
+    ):
+        self.fileName = fileName
+        self.names = sorted(grid)
+        self.variants = [
+            dict(zip(self.names, values))
+            for values in itertools.product(*[grid[name] for name in self.names])
+        ]
+        self.patterns = tuple(patterns)
+        self.preview = preview
+        self.results = []
+
+    ## Compute dots of all variants once
+    def _templates(self):
+        writer = CC6Writer()
+        lv1xnum, lv1ynum, lv2xnum, lv2ynum = self.patterns[:4]
+        for params in self.variants:
+            writer.setShapeBase(**params)
+            for lv2y in range(lv2ynum):
+                for lv2x in range(lv2xnum):
+                    for lv1y in range(lv1ynum):
+                        for lv1x in range(lv1xnum):
+                            writer.shapeTemplate(lv1x, lv1y, lv2x, lv2y)
+        return writer._templates
+
+    ## Write all variants and the manifest
+    #
+    # @param workers Number of processes
+    def run(self, workers=None):
+        jobs = [
+            ("%s_%03d" % (self.fileName, i), params, self.patterns, self.preview)
+            for i, params in enumerate(self.variants)
+        ]
+        with multiprocessing.Pool(workers, _sweepInit, (self._templates(),)) as pool:
+            self.results = []
+            for result in pool.imap(_sweepWorker, jobs):
+                self.results.append(result)
+                print("%s: %d objects, %.1f s" % (result["file"], result["commands"], result["time"]))
+        self.writeManifest()
+        return self.results
+
+    ## Write manifest as text table and JSON
+    def writeManifest(self):
+        with open(self.fileName + "_manifest.txt", "w") as f:
+            f.write(
+                "# file\t%s\tobjects\terrors\ttime(s)\r\n" % "\t".join(self.names)
+            )
+            for result in self.results:
+                f.write(
+                    "%s\t%s\t%d\t%d\t%.1f\r\n"
+                    % (
+                        result["file"],
+                        "\t".join(str(result["params"][name]) for name in self.names),
+                        result["commands"],
+                        result["errors"],
+                        result["time"],
+                    )
+                )
+        with open(self.fileName + "_manifest.json", "w") as f:
+            json.dump(
+                dict(patterns=self.patterns, variants=self.results), f, indent=2
+            )
+
+
+## "name=v1,v2,..." to (name, [values])
+def _parseParam(text):
+    name, values = text.split("=", 1)
+    return name, [float(v) if "." in v else int(v) for v in values.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate CC6 jobs for myShape parameter grid")
+    parser.add_argument("fileName")
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        help="myShape constant and values, e.g. dose=40,50,60 (repeat for more)",
+    )
+    parser.add_argument(
+        "--patterns",
+        default="10,10,5,5,5000,5000,1.0,1400",
+        help="createPatterns arguments lv1xnum,lv1ynum,lv2xnum,lv2ynum,"
+        "lv1width,lv1height,dose_time,size10BitMarker",
+    )
+    parser.add_argument("--preview", default="sync", choices=("sync", "deferred", "png", "off"))
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPUs)")
+    args = parser.parse_args()
+
+    values = [float(v) for v in args.patterns.split(",")]
+    patterns = [int(v) for v in values[:4]] + values[4:]
+    grid = dict(_parseParam(text) for text in args.param)
+    ParameterSweep(args.fileName, grid, patterns, args.preview).run(args.workers)
+
+
+if __name__ == "__main__":
+    main()
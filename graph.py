@@ -1,22 +1,20 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
-file_name = '06_#83_4_90.txt' #''が絶対必要
-f = np.loadtxt(file_name,delimiter='\t',) #なぜか区切り文字が'\t'、tab区切りを意味するらしい
+from mr_data import loadMeasurement
+from mr_sweep import baseline
 
-a = np.array(f)
+file_name = '06_#83_4_90.txt' #''が絶対必要
+m = loadMeasurement(file_name) #tab区切り、2回目からは06_#83_4_90.txt.npyを読む
 
-a_split = np.hsplit(a,6) #列方向(縦方向)に1列ごとに分割 分割数に注意
- 
-b_1 = a_split[0] #磁場　#それぞれ1対1対応のデータ
-b_2 = a_split[1] #抵抗値
-b_3 = a_split[2] #経過時間
-b_4 = a_split[3] #電圧
-b_5 = a_split[4] #電流
-#b_6 = a_split[5] #現在時間(タイムスタンプ)
+b_1 = m.field[:, None] #磁場　#それぞれ1対1対応のデータ (N,1)の列、コピーなし
+b_2 = m.resistance[:, None] #抵抗値
+b_3 = m.time[:, None] #経過時間
+b_4 = m.voltage[:, None] #電圧
+b_5 = m.current[:, None] #電流
+#b_6 = m.timestamp[:, None] #現在時間(タイムスタンプ)
 
-sorted_b_2 = np.sort(b_2,axis=0) #昇順に並べ替え,列ごとに並べ替え
-b_2_ave = np.mean(sorted_b_2[:10]) #最低値から10点の平均
+b_2_ave = baseline(m.resistance, 10) #最低値から10点の平均 (全部は並べ替えない)
 b_2_ratio=b_2/b_2_ave #MR比に直す
 
 
@@ -30,7 +28,7 @@ print(b_2_ave)
 #ここからorigin用データ作成エリア
 output_file_name = "up_mr_for_o.txt"
 
-# b_1とsorted_b_2を列方向に結合
+# b_1とyを列方向に結合
 output_data = np.hstack((b_1, y))
 
 # ファイルに保存
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.mr
+#
+# MR analysis of all measurement files in a directory (graph.py for many files)
+#
+# Usage: python mr_batch.py data/ --workers 8
+#        Writes xxx_mr_for_o.txt and xxx.png for every measurement xxx.txt,
+#        and the table mr_summary.txt (see mr_sweep for switching fields)
+
+import argparse
+import glob
+import multiprocessing
+import os
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from mr_data import COLUMNS, loadMeasurement
+from mr_sweep import SweepAnalysis
+
+
+## True if first line of file has the 6 numeric columns of a measurement
+def isMeasurement(fileName):
+    try:
+        with open(fileName, "rb") as f:
+            line = f.readline(4096).split(b"\t")
+        if len(line) != len(COLUMNS):
+            return False
+        [float(value) for value in line]
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+## Measurement files in directory (sorted)
+#
+# @param pattern Glob pattern of candidates
+def findMeasurements(directory, pattern="*.txt"):
+    return [
+        fileName
+        for fileName in sorted(glob.glob(os.path.join(glob.escape(directory), pattern)))
+        if isMeasurement(fileName)
+    ]
+
+
+## Plot MR curve (same style as graph.py) to image file
+def plotMR(field, mr, baseline, imageName, title=None):
+    figure = Figure(figsize=(6.4, 4.8))
+    axes = figure.subplots()
+    axes.scatter(field, mr, s=20, c="blue", alpha=1, edgecolors="None")
+    axes.plot(field, mr, marker="none", linestyle="-", c="blue")
+    axes.set_xlabel(r"Magnetic Field $\mu_0 H$ (mT)", fontsize=20)
+    axes.set_ylabel(r"Resistance $R$(%)", fontsize=20)
+    axes.tick_params(direction="in", labelsize=15)
+    axes.set_title(title or "", fontsize=12)
+    axes.text(
+        0.98, 0.95, "%g" % baseline, transform=axes.transAxes, ha="right", va="top", fontsize=12
+    )
+    figure.tight_layout()
+    figure.savefig(imageName, dpi=300)
+
+
+## Analyze one measurement file (in worker process)
+#
+# @param job (fileName, output directory or None for same as file)
+# @return Summary dict of file
+def analyzeFile(job):
+    fileName, outDir = job
+    m = loadMeasurement(fileName)
+    sweep = SweepAnalysis(m.field, m.resistance)
+    baseline, mr = sweep.baseline, sweep.mr
+    # Switching fields: mean peak fields of decreasing / increasing branches
+    down = sweep.peakField[sweep.direction < 0]
+    up = sweep.peakField[sweep.direction > 0]
+    hc, shift = sweep.hysteresis()
+
+    stem = os.path.splitext(os.path.basename(fileName))[0]
+    outDir = outDir or os.path.dirname(fileName)
+    #origin用データ
+    np.savetxt(
+        os.path.join(outDir, stem + "_mr_for_o.txt"),
+        np.stack((m.field, mr), axis=1),
+        delimiter="\t",
+    )
+    plotMR(m.field, mr, baseline, os.path.join(outDir, stem + ".png"), stem)
+    return dict(
+        file=fileName,
+        points=len(m),
+        baseline=float(baseline),
+        maxMR=float(mr.max()),
+        branches=len(sweep),
+        switchDown=float(down.mean()) if len(down) else np.nan,
+        switchUp=float(up.mean()) if len(up) else np.nan,
+        hc=float(hc),
+        shift=float(shift),
+    )
+
+
+## Write summary table (tab separated)
+def writeSummary(results, fileName):
+    with open(fileName, "w") as f:
+        f.write(
+            "# file\tpoints\tbaseline(ohm)\tmaxMR(%)\tbranches"
+            "\tswitchDown(mT)\tswitchUp(mT)\tHc(mT)\tshift(mT)\n"
+        )
+        for r in results:
+            f.write(
+                "%s\t%d\t%.6g\t%.6g\t%d\t%.6g\t%.6g\t%.6g\t%.6g\n"
+                % (
+                    os.path.basename(r["file"]),
+                    r["points"],
+                    r["baseline"],
+                    r["maxMR"],
+                    r["branches"],
+                    r["switchDown"],
+                    r["switchUp"],
+                    r["hc"],
+                    r["shift"],
+                )
+            )
+
+
+## Analyze all files in a process pool
+#
+# @param workers Number of processes (None: all CPUs)
+# @return Summary dicts in order of files
+def analyzeFiles(fileNames, outDir=None, workers=None):
+    jobs = [(fileName, outDir) for fileName in fileNames]
+    if workers == 1 or len(jobs) <= 1:
+        return [analyzeFile(job) for job in jobs]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(analyzeFile, jobs, chunksize=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MR analysis of all measurement files")
+    parser.add_argument("directory", nargs="?", default=".")
+    parser.add_argument("--pattern", default="*.txt", help="file names to look at")
+    parser.add_argument("--out", help="directory of outputs (default: same as files)")
+    parser.add_argument("--summary", default="mr_summary.txt")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPUs)")
+    args = parser.parse_args()
+
+    fileNames = findMeasurements(args.directory, args.pattern)
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    results = analyzeFiles(fileNames, args.out, args.workers)
+    summary = os.path.join(args.out or args.directory, args.summary)
+    writeSummary(results, summary)
+    for r in results:
+        print(
+            "%s: R0 %.6g ohm, MR %.3f %%, switching %.1f / %.1f mT, Hc %.1f mT"
+            % (
+                os.path.basename(r["file"]),
+                r["baseline"],
+                r["maxMR"],
+                r["switchDown"],
+                r["switchUp"],
+                r["hc"],
+            )
+        )
+    print("%d files, summary in %s" % (len(results), summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.mr
+#
+# Loader of MR measurement files (tab separated, 6 columns, see graph.py)
+#
+# Usage: python mr_data.py 06_#83_4_90.txt   (makes the sidecar and prints a summary)
+
+import argparse
+import io
+import os
+
+import numpy as np
+
+## Columns of measurement files
+COLUMNS = (
+    "field",  # 磁場 (mT)
+    "resistance",  # 抵抗値
+    "time",  # 経過時間
+    "voltage",  # 電圧
+    "current",  # 電流
+    "timestamp",  # 現在時間(タイムスタンプ)
+)
+
+
+## Columns of one measurement
+#
+#  data is a (6, N) array (one row per column, e.g. a memory-mapped
+#  sidecar), the named columns are views of its rows without copying.
+class MRData:
+    def __init__(self, data, fileName=None):
+        self.data = data
+        self.fileName = fileName
+        for i, name in enumerate(COLUMNS):
+            setattr(self, name, data[i])
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    ## All columns as N x 6 array (view, same as np.loadtxt of the file)
+    def table(self):
+        return self.data.T
+
+
+## Parse complete lines of measurement text
+#
+# @param text bytes of complete lines
+# @param fileName File name for error messages
+# @return N x 6 float array
+def parseLines(text, delimiter="\t", fileName="measurement"):
+    rows = np.loadtxt(io.StringIO(text.decode("ascii")), delimiter=delimiter, ndmin=2)
+    if rows.shape[1] != len(COLUMNS):
+        raise ValueError("%s: rows do not have %d columns" % (fileName, len(COLUMNS)))
+    return rows
+
+
+## Parse measurement text in chunks
+#
+#  Each chunk of complete lines is parsed by the C parser of np.loadtxt,
+#  so values are the same as np.loadtxt of the whole file.
+# @param fileName Tab separated text file
+# @param chunkSize Bytes parsed at once
+# @param delimiter Column separator
+# @return (6, N) float array
+def parseMeasurement(fileName, chunkSize=1 << 22, delimiter="\t"):
+    parts = []
+    rest = b""
+    with open(fileName, "rb") as f:
+        while True:
+            block = f.read(chunkSize)
+            text = rest + block
+            if block:
+                # Parse complete lines only
+                end = text.rfind(b"\n") + 1
+                text, rest = text[:end], text[end:]
+            if text.strip():
+                parts.append(parseLines(text, delimiter, fileName))
+            if not block:
+                break
+    if not parts:
+        return np.zeros((len(COLUMNS), 0))
+    return np.ascontiguousarray(np.concatenate(parts).T)
+
+
+## Binary sidecar of measurement file (standard .npy)
+def sidecarName(fileName):
+    return fileName + ".npy"
+
+
+## State of measurement file the sidecar was made from
+def metaName(fileName):
+    return sidecarName(fileName) + ".meta"
+
+
+## Text of meta file: size and mtime_ns of measurement file, size of sidecar
+def _metaText(stat, sidecarSize):
+    return "%d %d %d\n" % (stat.st_size, stat.st_mtime_ns, sidecarSize)
+
+
+## Write file through a temporary file (readers never see half written files)
+#
+# @param write Function writing the contents to an open binary file
+def _replace(fileName, write):
+    temporary = "%s.%d.tmp" % (fileName, os.getpid())
+    try:
+        with open(temporary, "wb") as f:
+            write(f)
+        os.replace(temporary, fileName)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+## Load measurement file, from its sidecar if the file is unchanged
+#
+#  The parsed columns are saved as (6, N) .npy next to the file (e.g.
+#  06_#83_4_90.txt.npy, np.load works on it), and size and modification
+#  time of the file in 06_#83_4_90.txt.npy.meta. Later runs memory-map the
+#  sidecar as long as size and time of the file are the same (a file
+#  rewritten within the same time tick, or copied with its time, has
+#  another size in practice). The meta file is written after the sidecar,
+#  so it never describes an older sidecar.
+# @param fileName Measurement text file
+# @param cache Use and write the sidecar
+# @return MRData
+def loadMeasurement(fileName, cache=True):
+    if not cache:
+        return MRData(parseMeasurement(fileName), fileName)
+    sidecar = sidecarName(fileName)
+    meta = metaName(fileName)
+    stat = os.stat(fileName)
+    try:
+        with open(meta) as f:
+            text = f.read()
+        if text == _metaText(stat, os.path.getsize(sidecar)):
+            return MRData(np.load(sidecar, mmap_mode="r"), fileName)
+    except (OSError, ValueError):
+        pass  # No or broken sidecar, parse again
+    data = parseMeasurement(fileName)
+    try:
+        _replace(sidecar, lambda f: np.save(f, data))
+        text = _metaText(stat, os.path.getsize(sidecar))
+        _replace(meta, lambda f: f.write(text.encode("ascii")))
+    except OSError:
+        pass  # e.g. read-only directory, sidecar is optional
+    return MRData(data, fileName)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load MR measurement file")
+    parser.add_argument("fileName", nargs="+")
+    args = parser.parse_args()
+    for fileName in args.fileName:
+        m = loadMeasurement(fileName)
+        print(
+            "%s: %d points, field %.1f to %.1f mT, resistance %.4g to %.4g"
+            % (
+                fileName,
+                len(m),
+                m.field.min(),
+                m.field.max(),
+                m.resistance.min(),
+                m.resistance.max(),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.mr
+#
+# Live MR plot of a measurement file that is still being written
+#
+# Usage: python mr_live.py 06_#83_4_90.txt --interval 1.0
+#        python mr_live.py 06_#83_4_90.txt --once --out live.png   (plot once and save)
+
+import argparse
+import os
+
+import numpy as np
+from matplotlib.transforms import Affine2D
+
+from mr_data import COLUMNS, parseLines
+
+
+## Reader of rows appended to a measurement file
+#
+#  Only bytes after the last read are read and parsed; a partial last line
+#  (the measurement program is writing it) is kept until it is complete.
+#  If the file becomes shorter (new measurement in the same file), read()
+#  starts again from the top and returns reset=True.
+class MeasurementTail:
+    def __init__(self, fileName, delimiter="\t"):
+        self.fileName = fileName
+        self.delimiter = delimiter
+        self._offset = 0
+        self._rest = b""
+
+    ## New complete rows
+    #
+    # @return (rows, reset): N x 6 float array, True if the file was restarted
+    def read(self):
+        reset = False
+        try:
+            size = os.path.getsize(self.fileName)
+        except OSError:
+            return np.zeros((0, len(COLUMNS))), reset  # Not made yet
+        if size < self._offset:
+            self._offset = 0
+            self._rest = b""
+            reset = True
+        if size == self._offset:
+            return np.zeros((0, len(COLUMNS))), reset
+        with open(self.fileName, "rb") as f:
+            f.seek(self._offset)
+            block = f.read(size - self._offset)
+        self._offset += len(block)
+        text = self._rest + block
+        end = text.rfind(b"\n") + 1
+        text, self._rest = text[:end], text[end:]
+        if not text.strip():
+            return np.zeros((0, len(COLUMNS))), reset
+        return parseLines(text, self.delimiter, self.fileName), reset
+
+
+## Live MR plot of a growing measurement file
+#
+#  Each update() parses only the new rows and appends them to preallocated
+#  column buffers (capacity doubled when full). The baseline (mean of the
+#  lowest points, as mr_sweep.baseline) is kept from the current lowest
+#  points and the new resistances only. The artists hold field and
+#  resistance; MR = (R / baseline - 1) * 100 is an affine transform of the
+#  resistance, so a new baseline only changes the transform of the artists
+#  instead of recomputing the MR of all points.
+#  Drawing: new points are drawn onto the saved image of the axes (blit),
+#  so an update costs the same for 100 or 10^6 points so far. The whole
+#  figure is drawn again only when the baseline changes (a new lowest
+#  point, rare after the first sweep) or points leave the axis limits
+#  (limits are widened with 25 % margin, so this happens a few times).
+#  HOWTO:
+#  1. live = LiveMR("06_#83_4_90.txt")
+#  2. live.run(interval=1.0)  # or live.update() from your own loop
+#  3. live.mr(), live.baseline for the values so far, live.save("live.png")
+class LiveMR:
+    ## @param fileName Measurement file (may not exist yet)
+    # @param points Number of lowest points averaged for the baseline
+    # @param axes matplotlib Axes to draw in (None: new pyplot figure)
+    # @param capacity Initial number of points of the buffers
+    def __init__(self, fileName, points=10, axes=None, capacity=4096):
+        self.fileName = fileName
+        self.points = points
+        self._tail = MeasurementTail(fileName)
+        self._capacity = capacity
+        self._clear()
+
+        if axes is None:
+            import matplotlib.pyplot as plt
+
+            axes = plt.figure().subplots()
+        self.axes = axes
+        self.canvas = axes.figure.canvas
+        # Resistance to MR (%), set in _setBaseline
+        self._transform = Affine2D()
+        transform = self._transform + axes.transData
+        style = dict(c="blue", transform=transform)
+        marker = dict(marker="o", markersize=np.sqrt(20), markeredgecolor="none", linestyle="none")
+        # All points (drawn with the figure) and points since then (blit)
+        (self._scatter,) = axes.plot([], [], **marker, **style)  # 散布図 (scatter s=20 と同じ大きさ)
+        (self._line,) = axes.plot([], [], linestyle="-", **style)  # 隣の点同士を線で結ぶ
+        (self._newScatter,) = axes.plot([], [], animated=True, **marker, **style)
+        (self._newLine,) = axes.plot([], [], linestyle="-", animated=True, **style)
+        axes.set_xlabel(r"Magnetic Field $\mu_0 H$ (mT)", fontsize=20)
+        axes.set_ylabel(r"Resistance $R$(%)", fontsize=20)
+        axes.tick_params(direction="in", labelsize=15)
+        self._text = axes.text(
+            0.98, 0.95, "", transform=axes.transAxes, ha="right", va="top", fontsize=12
+        )
+        axes.set_title(os.path.basename(fileName), fontsize=12)
+        axes.figure.tight_layout()
+        self.redraws = 0  # Number of whole figure draws
+        self._background = None
+        self.canvas.mpl_connect("draw_event", self._onDraw)
+
+    def _clear(self):
+        self._data = np.zeros((len(COLUMNS), self._capacity))
+        self._count = 0
+        self._drawn = 0  # Points in _scatter, _line
+        self._blitted = 0  # Points drawn so far
+        self._lowest = np.zeros(0)
+        self._low = np.full(2, np.inf)  # Minimum field, resistance
+        self._high = np.full(2, -np.inf)  # Maximum field, resistance
+        self.baseline = np.nan
+
+    def __len__(self):
+        return self._count
+
+    ## Columns read so far (views)
+    @property
+    def field(self):
+        return self._data[0, : self._count]
+
+    @property
+    def resistance(self):
+        return self._data[1, : self._count]
+
+    ## MR (%) of points read so far
+    def mr(self):
+        return (self.resistance / self.baseline - 1) * 100
+
+    ## Append rows (N x 6) to the buffers and update baseline and ranges
+    def _append(self, rows):
+        count = self._count + len(rows)
+        if count > self._data.shape[1]:
+            capacity = self._data.shape[1]
+            while capacity < count:
+                capacity *= 2
+            data = np.zeros((len(COLUMNS), capacity))
+            data[:, : self._count] = self._data[:, : self._count]
+            self._data = data
+        self._data[:, self._count : count] = rows.T
+        self._count = count
+
+        # Lowest points of the old lowest and the new resistances
+        lowest = np.concatenate((self._lowest, rows[:, 1]))
+        if len(lowest) > self.points:
+            lowest = np.partition(lowest, self.points - 1)[: self.points]
+        self._lowest = lowest
+        self._low = np.minimum(self._low, rows[:, :2].min(axis=0))
+        self._high = np.maximum(self._high, rows[:, :2].max(axis=0))
+
+    ## Set baseline (transform of the artists)
+    #
+    # @return True if changed
+    def _setBaseline(self, value):
+        if value == self.baseline:
+            return False
+        self.baseline = value
+        # y = (R / baseline - 1) * 100
+        self._transform.clear().translate(0, -value).scale(1, 100 / value)
+        self._text.set_text("%g" % value)
+        return True
+
+    ## Widen axis limits (25 % margin) if points are outside
+    #
+    # @param force Set limits from the ranges even if all points are inside
+    # @return True if changed
+    def _setLimits(self, force=False):
+        low, high = self._low, self._high
+        mr = (np.array([low[1], high[1]]) / self.baseline - 1) * 100
+        changed = False
+        for getLimits, setLimits, (a, b) in (
+            (self.axes.get_xlim, self.axes.set_xlim, (low[0], high[0])),
+            (self.axes.get_ylim, self.axes.set_ylim, mr),
+        ):
+            left, right = getLimits()
+            if force or a < left or b > right:
+                margin = (b - a) * 0.25 or 1.0
+                setLimits(a - margin, b + margin)
+                changed = True
+        return changed
+
+    ## Read new rows and update the plot
+    #
+    # @return Number of new points
+    def update(self):
+        rows, reset = self._tail.read()
+        if reset:
+            self._clear()
+        if len(rows):
+            self._append(rows)
+        if self._count == 0:
+            if reset:
+                self._redraw()
+            return 0
+        changed = self._setBaseline(np.mean(np.sort(self._lowest)))
+        changed = self._setLimits(force=changed or reset) or changed
+        if changed or reset or self._background is None or not self.canvas.supports_blit:
+            self._redraw()
+        elif self._blitted < self._count:
+            self._blit()
+        return len(rows)
+
+    ## Draw the whole figure with all points
+    def _redraw(self):
+        self._scatter.set_data(self.field, self.resistance)
+        self._line.set_data(self.field, self.resistance)
+        self._newScatter.set_data([], [])
+        self._newLine.set_data([], [])
+        self._drawn = self._blitted = self._count
+        self._background = None
+        self.redraws += 1
+        self.canvas.draw_idle()
+
+    ## Draw points after the last drawn one onto the saved axes image
+    def _blit(self):
+        start, end = self._blitted, self._count
+        self.canvas.restore_region(self._background)
+        self._newScatter.set_data(self.field[start:end], self.resistance[start:end])
+        # Line from the last drawn point
+        self._newLine.set_data(self.field[start - 1 : end], self.resistance[start - 1 : end])
+        self.axes.draw_artist(self._newScatter)
+        self.axes.draw_artist(self._newLine)
+        self.canvas.blit(self.axes.bbox)
+        self._background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self._blitted = end
+
+    def _onDraw(self, event):
+        if not self.canvas.supports_blit:
+            return
+        if self._drawn < self._blitted:
+            # Figure drawn by the window (e.g. resized) without the blitted
+            # points, draw again at the next update
+            self._background = None
+        else:
+            self._background = self.canvas.copy_from_bbox(self.axes.bbox)
+
+    ## Save figure with all points so far
+    def save(self, fileName, dpi=300):
+        if self._count:
+            self._redraw()
+        self.axes.figure.savefig(fileName, dpi=dpi)
+        self._background = None  # Saved at other dpi
+
+    ## Update every interval seconds until the window is closed
+    def run(self, interval=1.0):
+        import matplotlib.pyplot as plt
+
+        plt.ioff()  # Only update() draws
+        self.update()
+        plt.show(block=False)
+        figure = self.axes.figure
+        while plt.fignum_exists(figure.number):
+            self.update()
+            self.canvas.start_event_loop(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live MR plot of a growing measurement file")
+    parser.add_argument("fileName")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between updates")
+    parser.add_argument("--points", type=int, default=10, help="lowest points of baseline")
+    parser.add_argument("--once", action="store_true", help="read the file once and exit")
+    parser.add_argument("--out", help="image file saved at exit")
+    args = parser.parse_args()
+
+    live = LiveMR(args.fileName, args.points)
+    if args.once:
+        live.update()
+    else:
+        try:
+            live.run(args.interval)
+        except KeyboardInterrupt:
+            pass
+    if args.out:
+        live.save(args.out)
+    print("%d points, baseline %.6g" % (len(live), live.baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+## @package MagLib.mr
+#
+# Field sweep branches and hysteresis metrics of MR measurements
+#
+# Usage: python mr_sweep.py 06_#83_4_90.txt
+
+import argparse
+
+import numpy as np
+
+from mr_data import loadMeasurement
+
+
+## Mean of the lowest points (baseline resistance of graph.py)
+#
+# The lowest points are selected with np.partition (O(n)); only they are
+# sorted, so the mean is the same as of the fully sorted column.
+def baseline(resistance, points=10):
+    points = min(points, len(resistance))
+    lowest = np.partition(resistance, points - 1)[:points]
+    return np.mean(np.sort(lowest))
+
+
+## Monotonic branches of a field sweep
+#
+# Steps without field change belong to the branch before them. Branches
+# with less than minPoints points (e.g. a last point after the sweep) are
+# dropped.
+# @param window Points of moving average of field used for the direction,
+#               for noisy fast sweeps (1: no averaging)
+# @return (starts, ends, direction) int arrays, branch k is
+#         field[starts[k]:ends[k] + 1] (turning points are in both
+#         branches), direction +1 increasing, -1 decreasing
+def branches(field, minPoints=3, window=1):
+    field = np.asarray(field, dtype=float)
+    if window > 1 and len(field) > window:
+        # Centered moving average (cumulative sum), ends padded
+        total = np.cumsum(np.concatenate(([0.0], field)))
+        average = (total[window:] - total[:-window]) / window
+        pad = window // 2
+        field = np.concatenate(
+            (np.full(pad, average[0]), average, np.full(len(field) - len(average) - pad, average[-1]))
+        )
+    step = np.sign(np.diff(field))
+    if not step.any():
+        return np.zeros(0, int), np.zeros(0, int), np.zeros(0, int)
+    # Zero steps take the direction of the step before (forward fill)
+    moving = np.flatnonzero(step)
+    last = np.maximum.accumulate(np.where(step != 0, np.arange(len(step)), moving[0]))
+    step = step[last]
+    turns = np.flatnonzero(step[1:] != step[:-1]) + 1
+    starts = np.concatenate(([0], turns))
+    ends = np.append(turns, len(step))
+    direction = step[starts].astype(int)
+    keep = ends - starts + 1 >= minPoints
+    return starts[keep], ends[keep], direction[keep]
+
+
+## Sweep analysis of one measurement
+#
+#  mr = (R / baseline - 1) * 100 as in graph.py. For every branch:
+#  - peakMR: maximum MR (%)
+#  - peakField: field at maximum MR (switching field, mT)
+#  - halfWidth: field range of points above half of the peak (mT)
+#  Peaks of decreasing and increasing branches give a coercivity like
+#  field (half distance) and shift (center), see hysteresis().
+#  All per branch values are computed with array operations on the
+#  branch number of every point, without loops over points.
+#  HOWTO:
+#  1. sweep = SweepAnalysis(m.field, m.resistance)  # m from mr_data.loadMeasurement
+#  2. sweep.peakField, sweep.hysteresis(), sweep.report()
+class SweepAnalysis:
+    ## @param field Field of all points (mT)
+    # @param resistance Resistance of all points
+    # @param points Number of lowest points averaged for the baseline
+    # @param minPoints Minimum points of a branch (see branches)
+    # @param window Moving average of field for branch directions (see branches)
+    def __init__(self, field, resistance, points=10, minPoints=3, window=1):
+        self.field = np.asarray(field)
+        self.baseline = baseline(resistance, points)
+        self.mr = (np.asarray(resistance) / self.baseline - 1) * 100
+        self.starts, self.ends, self.direction = branches(self.field, minPoints, window)
+        self._branchMetrics()
+
+    def _branchMetrics(self):
+        if len(self.starts) == 0:
+            self.peakMR = self.peakField = self.halfWidth = np.zeros(0)
+            return
+        counts = self.ends - self.starts + 1
+        # Point indices of all branches, and branch number of each
+        branch = np.repeat(np.arange(len(counts)), counts)
+        index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        index += np.repeat(self.starts, counts)
+        mr = self.mr[index]
+        field = self.field[index]
+        first = np.cumsum(counts) - counts
+
+        # Maximum of each branch: first point after sorting by (branch, -mr)
+        order = np.lexsort((-mr, branch))
+        peak = order[first]
+        self.peakMR = mr[peak]
+        self.peakField = field[peak]
+
+        # Field range of points above half maximum
+        low = np.minimum.reduceat(mr, first)
+        above = mr >= ((self.peakMR + low) / 2)[branch]
+        fieldAbove = np.where(above, field, np.nan)
+        self.halfWidth = np.fmax.reduceat(fieldAbove, first) - np.fmin.reduceat(fieldAbove, first)
+
+    def __len__(self):
+        return len(self.starts)
+
+    ## Coercivity like field and shift from peak fields
+    #
+    # @return (hc, shift) (mT): half distance and center of the mean peak
+    #         fields of decreasing and increasing branches, nan if one
+    #         direction is missing
+    def hysteresis(self):
+        down = self.peakField[self.direction < 0]
+        up = self.peakField[self.direction > 0]
+        if len(down) == 0 or len(up) == 0:
+            return np.nan, np.nan
+        down = down.mean()
+        up = up.mean()
+        return abs(up - down) / 2, (up + down) / 2
+
+    ## Report as text lines
+    def report(self):
+        lines = ["Baseline: %.6g ohm, %d branches" % (self.baseline, len(self))]
+        for k in range(len(self)):
+            lines.append(
+                "  %s %4d-%4d: peak %.3f %% at %.1f mT, half width %.1f mT"
+                % (
+                    "up  " if self.direction[k] > 0 else "down",
+                    self.starts[k],
+                    self.ends[k],
+                    self.peakMR[k],
+                    self.peakField[k],
+                    self.halfWidth[k],
+                )
+            )
+        hc, shift = self.hysteresis()
+        lines.append("Hc %.1f mT, shift %.1f mT" % (hc, shift))
+        return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Branches and hysteresis of MR measurement")
+    parser.add_argument("fileName")
+    parser.add_argument("--points", type=int, default=10, help="lowest points of baseline")
+    parser.add_argument("--min-points", type=int, default=3, help="minimum points of branch")
+    parser.add_argument("--window", type=int, default=1, help="moving average of field (points)")
+    args = parser.parse_args()
+
+    m = loadMeasurement(args.fileName)
+    for line in SweepAnalysis(
+        m.field, m.resistance, args.points, args.min_points, args.window
+    ).report():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
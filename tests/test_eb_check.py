@@ -0,0 +1,42 @@
+# -*- coding:utf-8 -*-
+import numpy as np
+
+from eb_cc6 import DWLL, DWSL, DWSPS, makeCommands
+from eb_check import OverlapChecker
+
+
+## Pair is reported where the rectangles touch, not between their centers
+def test_position_where_close():
+    # L shaped corner of two long rectangles (cells of 5 nm, y downwards)
+    x1, y1, x2, y2 = np.array([[0, 600, 600, 59400], [600, 0, 59400, 600]]).T
+    rows = makeCommands(DWSL, x1, y1, x2, y2, np.array([0.5, 0.5]))
+    checker = OverlapChecker().check(rows)
+    assert len(checker) == 1
+    assert np.allclose(checker.position[0], (3000, 297000))
+
+
+## Pairs of pads next to fine dots are the same as comparing all pairs
+def test_large_and_small_shapes(monkeypatch):
+    r = np.random.default_rng(1)
+    n = 400
+    op = r.choice([DWLL, DWSL, DWSPS], n)
+    x1 = r.integers(0, 60000, n)
+    y1 = r.integers(0, 60000, n)
+    size = np.where(r.random(n) < 0.05, r.integers(2000, 40000, n), r.integers(0, 20, n))
+    x2 = np.minimum(x1 + size, 60000)
+    y2 = np.where(op == DWSL, np.minimum(y1 + size, 60000), y1)
+    x2 = np.where(op == DWSPS, x1, x2)
+    rows = makeCommands(op, x1, y1, x2, y2, np.ones(n))
+    # Pad over (almost) the whole patch
+    rows = np.concatenate((rows, makeCommands(DWSL, [300], [300], [59400], [59400], [1.0])))
+
+    checker = OverlapChecker(minGap=30).check(rows)
+    found = set(zip(checker.first.tolist(), checker.second.tolist()))
+
+    # Reference: exact check of all pairs
+    monkeypatch.setattr(
+        OverlapChecker, "_candidates", lambda self, lo, hi: np.triu_indices(len(lo), 1)
+    )
+    everything = OverlapChecker(minGap=30).check(rows)
+    assert found == set(zip(everything.first.tolist(), everything.second.tolist()))
+    assert any(j == n for _, j in found)
@@ -0,0 +1,50 @@
+# -*- coding:utf-8 -*-
+import io
+
+import numpy as np
+import pytest
+
+from eb_dot import CC6Writer
+
+
+def _patterns(useTemplate):
+    writer = CC6Writer()
+    sink = io.StringIO()
+    writer.open("test", cc6Sink=sink, preview="off")
+    writer.setShapeBase(dose=0)
+    writer.createPatterns(2, 2, 1, 1, 5000, 5000, useTemplate=useTemplate)
+    writer.setShapeBase(dose=50)
+    writer.createPatterns(2, 2, 1, 1, 5000, 5000, useTemplate=useTemplate)
+    writer.close()
+    return sink.getvalue(), writer._errorCount
+
+
+## Templates give the same CC6 as myShapeDots, also after dose 0
+def test_template_dose(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    plain = _patterns(False)
+    template = _patterns(True)
+    assert "nan" not in template[0]
+    assert template == plain
+
+
+def test_out_dose_not_finite():
+    writer = CC6Writer()
+    assert writer._out_dose(float("nan"))
+    assert list(writer._out_dose(np.array([1.0, np.nan, np.inf]))) == [False, True, True]
+
+
+def test_batch_shape_checked(tmp_path):
+    writer = CC6Writer()
+    sink = io.StringIO()
+    writer.open(str(tmp_path / "test"), cc6Sink=sink, preview="off")
+    # 4 x 5 array with doseTime: columns do not match
+    with pytest.raises(ValueError):
+        writer.drawLines(np.zeros((4, 5)), doseTime=2.0)
+    with pytest.raises(ValueError):
+        writer.drawSpots(np.zeros(6))
+    # Single shape as 1-D array
+    writer.drawLines([1000.0, 1000.0, 2000.0, 1000.0, 2.0])
+    writer.drawSpots(np.zeros((0, 3)))
+    writer.close()
+    assert writer._commandCount == 1
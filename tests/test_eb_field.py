@@ -0,0 +1,49 @@
+# -*- coding:utf-8 -*-
+import os
+
+import pytest
+
+from eb_estimate import ExposureEstimator
+from eb_field import StitchWriter
+
+
+## createPatterns on a StitchWriter (own open() without the CC6Writer helpers)
+def test_stitch_create_patterns(tmp_path):
+    name = str(tmp_path / "stitch")
+    writer = StitchWriter(2, 1)
+    writer.open(name, preview="off")
+    writer.createPatterns(2, 2, 1, 1, 5000, 5000)
+    writer.close()
+    assert writer._errorCount == 0
+    assert writer._commandCount > 0
+    assert os.path.exists(name + "_fields.txt")
+    with open(name + "_fields.txt") as f:
+        jobs = [line.split("\t")[0] for line in f if not line.startswith("#")]
+    assert jobs
+    for job in jobs:
+        assert os.path.exists(job + ".CC6")
+
+
+## Shapes on the right / top edge of the layout are in the last field
+def test_outer_edge(tmp_path):
+    writer = StitchWriter(1, 1)
+    writer.open(str(tmp_path / "edge"), preview="off")
+    writer.drawSpot(300000, 300000, 1.0)
+    writer.drawLine(300000, 0, 300000, 1000, 1.0)
+    writer.drawSpot(300010, 0, 1.0)  # Outside
+    writer.close()
+    assert (writer._commandCount, writer._errorCount) == (2, 1)
+
+
+## Every field writer gets its own copy of helper objects
+def test_helpers_per_field(tmp_path):
+    estimator = ExposureEstimator()
+    writer = StitchWriter(2, 1)
+    writer.open(str(tmp_path / "fields"), preview="off", estimator=estimator)
+    writer.drawSpot(1000, 1000, 1.0)
+    writer.drawSpot(301000, 1000, 1.0)
+    writer.close()
+    assert writer._commandCount == 2
+    assert estimator.commandCount == 0  # Not used itself
+    with pytest.raises(ValueError):
+        StitchWriter(1, 1).open(str(tmp_path / "x"), preview=object())
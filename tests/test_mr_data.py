@@ -0,0 +1,31 @@
+# -*- coding:utf-8 -*-
+import os
+
+import numpy as np
+
+from mr_data import loadMeasurement, sidecarName
+
+
+def _write(fileName, rows):
+    np.savetxt(fileName, rows, delimiter="\t")
+
+
+## Sidecar is used for the same file, not after a rewrite with the same time
+def test_sidecar_size_checked(tmp_path):
+    fileName = str(tmp_path / "m.txt")
+    rows = np.arange(60.0).reshape(10, 6)
+    _write(fileName, rows)
+    first = loadMeasurement(fileName)
+    # Sidecar is a standard .npy file
+    assert np.array_equal(np.load(sidecarName(fileName)), rows.T)
+    second = loadMeasurement(fileName)
+    assert isinstance(second.data, np.memmap)
+    assert np.array_equal(second.table(), rows)
+
+    stat = os.stat(fileName)
+    _write(fileName, rows[:4])
+    os.utime(fileName, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    third = loadMeasurement(fileName)
+    assert len(first) == 10
+    assert len(third) == 4
+    assert np.array_equal(third.table(), rows[:4])